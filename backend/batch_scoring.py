@@ -0,0 +1,128 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from pydantic import AfterValidator
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from instrumentation import stage
+from serialization import dumps_line
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPES = {"text/csv", "application/csv"}
+ARROW_MEDIA_TYPES = {"application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file"}
+
+
+def _read_arrow(body, content_type):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=415, detail="Arrow uploads need pyarrow installed on the server.")
+
+    if content_type == "application/vnd.apache.arrow.file":
+        table = pa.ipc.open_file(pa.BufferReader(body)).read_all()
+    else:
+        table = pa.ipc.open_stream(pa.BufferReader(body)).read_all()
+    return table.to_pandas()
+
+
+def parse_batch(body, content_type):
+    """Parses a JSON array (or {"records": [...]}), CSV or Arrow upload into a DataFrame."""
+    if content_type in ("", "application/json"):
+        records = json.loads(body)
+        if isinstance(records, dict):
+            records = records.get("records")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array of records.")
+        return pd.DataFrame.from_records(records)
+    if content_type in CSV_MEDIA_TYPES:
+        return pd.read_csv(io.BytesIO(body))
+    if content_type in ARROW_MEDIA_TYPES:
+        return _read_arrow(body, content_type)
+    raise HTTPException(status_code=415, detail=f"Unsupported content type '{content_type}'.")
+
+
+def coerce_batch(frame, schema, max_rows, normalizers=None):
+    """Checks the batch against `schema` (column -> type) and returns it in schema column order.
+
+    `normalizers` (column -> [function]) are applied to string columns, as the
+    input model's validators would be for a single record.
+    """
+    missing = [column for column in schema if column not in frame.columns]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing columns: {', '.join(missing)}")
+    if len(frame) > max_rows:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {max_rows} rows.")
+
+    frame = frame[list(schema)].copy()
+    for column, column_type in schema.items():
+        if column_type is str:
+            frame[column] = frame[column].astype(str)
+            for normalize in (normalizers or {}).get(column, ()):
+                frame[column] = frame[column].map(normalize)
+            continue
+        try:
+            values = pd.to_numeric(frame[column], errors='raise')
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=422, detail=f"Column '{column}' must be numeric.")
+        if values.isna().any():
+            raise HTTPException(status_code=422, detail=f"Column '{column}' has missing values.")
+        if column_type is int and not np.all(np.mod(values, 1) == 0):
+            raise HTTPException(status_code=422, detail=f"Column '{column}' must contain whole numbers.")
+        frame[column] = values.astype(column_type)
+    return frame
+
+
+async def read_body(request, max_bytes):
+    """The request body, or a 413 as soon as it is known to be over `max_bytes`."""
+    too_large = HTTPException(status_code=413, detail=f"Batch uploads are limited to {max_bytes} bytes.")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+    # Chunked uploads have no Content-Length, so the total is also checked as the body arrives
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+async def read_batch(request, input_model, max_rows, max_bytes):
+    """Reads and validates a batch upload against the fields of a single-record input model."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await read_body(request, max_bytes)
+    fields = input_model.model_fields
+    schema = {name: field.annotation for name, field in fields.items()}
+    normalizers = {
+        name: [item.func for item in field.metadata if isinstance(item, AfterValidator)]
+        for name, field in fields.items()
+    }
+    with stage("parse"):
+        try:
+            frame = await run_in_threadpool(parse_batch, body, content_type)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not parse the upload: {e}")
+        return await run_in_threadpool(coerce_batch, frame, schema, max_rows, normalizers)
+
+
+def stream_predictions(frame, predict_chunk, chunk_size):
+    """Scores `frame` in chunks of `chunk_size` rows and streams one NDJSON line per row, in order.
+
+    `predict_chunk` is a coroutine function that takes a DataFrame slice and
+    returns a list of result dicts; each chunk is a single vectorized model call
+    that the caller dispatches off the event loop.
+    """
+    async def generate():
+        for start in range(0, len(frame), chunk_size):
+            results = await predict_chunk(frame.iloc[start:start + chunk_size])
+            with stage("serialize"):
+                lines = "".join(dumps_line(result) for result in results)
+            yield lines
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class BatcherStats:
+    """Running counters describing how requests were coalesced into batches."""
+
+    def __init__(self, max_batch_size):
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.batch_size_counts = [0] * (max_batch_size + 1)
+        self.total_queue_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+        self.total_predict_ms = 0.0
+
+    def record(self, batch_size, queue_waits_ms, predict_ms):
+        self.batches += 1
+        self.items += batch_size
+        self.batch_size_counts[batch_size] += 1
+        self.total_queue_wait_ms += sum(queue_waits_ms)
+        self.max_queue_wait_ms = max(self.max_queue_wait_ms, max(queue_waits_ms))
+        self.total_predict_ms += predict_ms
+
+    def snapshot(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {
+                str(size): count for size, count in enumerate(self.batch_size_counts) if count
+            },
+            "avg_queue_wait_ms": self.total_queue_wait_ms / self.items if self.items else 0.0,
+            "max_queue_wait_ms": self.max_queue_wait_ms,
+            "avg_predict_ms": self.total_predict_ms / self.batches if self.batches else 0.0,
+        }
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into one batched predict call.
+
+    The first item to arrive opens a window of `max_wait_ms`; everything submitted
+    before the window closes (or until `max_batch_size` items are waiting) is
+    collated (`np.stack` unless `collate_fn` is given) and passed to `predict_fn`
+    in one call. Both steps run on a dedicated worker thread so the event loop
+    keeps accepting requests, and row `i` of the output is handed back to the
+    `i`-th caller.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=10, name="batcher", collate_fn=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.collate_fn = collate_fn or np.stack
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.stats = BatcherStats(max_batch_size)
+        self._pending = []
+        self._has_items = asyncio.Event()
+        self._is_full = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._worker = None
+
+    async def submit(self, item):
+        """Queues one input and waits for its row of the batched prediction."""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._is_full.set()
+        return await future
+
+    async def stop(self):
+        """Cancels the batching loop and fails any requests still waiting."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for _, future, _ in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} is shutting down"))
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+    def _predict_batch(self, items):
+        # Collation runs on the worker thread too, so stacking/normalizing a
+        # large batch never blocks the event loop.
+        return self.predict_fn(self.collate_fn(items))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._has_items.wait()
+
+            # Hold the window open until the oldest item has waited max_wait,
+            # unless the batch fills up first.
+            oldest = self._pending[0][2]
+            remaining = oldest + self.max_wait - time.perf_counter()
+            if remaining > 0 and len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._is_full.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._is_full.clear()
+
+            # Callers that gave up (client disconnects) don't need a slot.
+            batch = [entry for entry in batch if not entry[1].cancelled()]
+            if not batch:
+                continue
+
+            dispatched = time.perf_counter()
+            try:
+                outputs = await loop.run_in_executor(
+                    self._executor, self._predict_batch, [item for item, _, _ in batch]
+                )
+            except Exception as e:
+                self.stats.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            self.stats.record(
+                len(batch),
+                [(dispatched - enqueued) * 1000.0 for _, _, enqueued in batch],
+                (finished - dispatched) * 1000.0,
+            )
+            for (_, future, _), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
@@ -0,0 +1,420 @@
+"""Load-test every CROPIX endpoint and store the results as JSON.
+
+    python benchmark.py run                          # starts the API + mock weather upstream itself
+    python benchmark.py run --url http://host:8000   # benchmarks an already running server
+    python benchmark.py compare benchmarks/old.json benchmarks/new.json
+    python benchmark.py serialization                # response encodings, no server needed
+
+Each scenario is driven separately with `--concurrency` in-flight requests
+(closed loop) for `--requests` requests after a warm-up, and reports
+p50/p95/p99 latency, throughput, mean response size, status codes and the
+server's peak RSS while it ran. `--format compact` and
+`--accept application/msgpack` benchmark the alternative wire formats. Results
+go to `benchmarks/<git commit>.json` unless `--output` is given; `compare`
+prints the differences and exits non-zero on regressions.
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from memory_report import current_rss
+
+BENCHMARK_DIR = 'benchmarks'
+SCENARIOS = (
+    "crop_yield", "soil_crop", "soil_crop_top_k", "fertilizer", "disease", "market_forecast", "market_scenarios",
+    "weather", "weather_lstm", "field_advisory", "yield_optimizer",
+)
+CITIES = ["Indore", "Bhopal", "Nagpur", "Jabalpur", "Raipur", "Gwalior", "Ujjain", "Sagar", "Satna", "Rewa"]
+
+
+def _scenarios(image_path):
+    with open(image_path, "rb") as f:
+        image_base64 = base64.b64encode(f.read()).decode()
+    soil = {"N": 90, "P": 42, "K": 43, "temperature": 20.8, "humidity": 82.0, "ph": 6.5, "rainfall": 202.9}
+    # name -> (path, payload(i)); payloads vary with the request number where caching would otherwise hide the work
+    return {
+        "crop_yield": ("/predict_crop_yield/", lambda i: {
+            **soil, "Crop": "Rice", "Season": "Kharif     ", "Area": 1000.0 + i % 100, "Fertilizer": 12000.0,
+            "Crop_Year": 2020, "Pesticide": 300.0, "Annual_Rainfall": 1200.0,
+        }),
+        "soil_crop": ("/recommend_soil_crop/", lambda i: {**soil, "rainfall": 150.0 + i % 100}),
+        "soil_crop_top_k": ("/recommend_soil_crop/top_k/", lambda i: {**soil, "rainfall": 150.0 + i % 100, "k": 3}),
+        "fertilizer": ("/recommend_fertilizer/", lambda i: {
+            "Crop": "Rice", "Current_N": 40.0 + i % 50, "Current_P": 20.0, "Current_K": 25.0,
+        }),
+        "disease": ("/detect_disease/", lambda i: {"image_base64": image_base64}),
+        "market_forecast": ("/forecast_market_prices/", lambda i: {
+            "crop_name": ["Wheat", "Rice", "Maize", "Soybean"][i % 4], "weeks_to_forecast": 1 + i % 12,
+        }),
+        "market_scenarios": ("/forecast_market_prices/scenarios/", lambda i: {
+            "crops": ["Wheat", "Rice", "Onion"], "weeks_to_forecast": 12,
+            "scenarios": [{"name": f"wheat_{change:+.2f}", "shocks": {"Wheat": change}}
+                          for change in (-0.2, -0.1, 0.1, 0.2 + i % 10 / 100)],
+        }),
+        "weather": ("/weather_forecast/", lambda i: {"city": CITIES[i % len(CITIES)], "days": 3}),
+        "weather_lstm": ("/weather_forecast_lstm/", lambda i: {"city": CITIES[i % len(CITIES)], "days": 7}),
+        "yield_optimizer": ("/predict_crop_yield/optimize/", lambda i: {
+            "Crop": "Rice", "Season": "Kharif", "Crop_Year": 2020, "Annual_Rainfall": 1000.0 + i % 500,
+            "Fertilizer": {"min": 1000.0, "max": 200000.0, "steps": 20},
+            "Pesticide": {"min": 0.0, "max": 5000.0, "steps": 10},
+            "Area": {"min": 100.0, "max": 5000.0, "steps": 5},
+        }),
+        "field_advisory": ("/field_advisory/", lambda i: {
+            **soil, "rainfall": 150.0 + i % 100, "Season": "Kharif", "Area": 1000.0, "Fertilizer": 12000.0,
+            "Crop_Year": 2020, "Pesticide": 300.0, "Annual_Rainfall": 1200.0, "city": CITIES[i % len(CITIES)],
+        }),
+    }
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    pids.extend(_process_tree(int(child)))
+        except OSError:
+            pass
+    return pids
+
+
+def _tree_rss(pid):
+    total = 0
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler:
+    """Tracks the peak RSS of the server: its whole process tree when we started it, else GET /memory/."""
+
+    def __init__(self, client, pid=None, interval=0.2):
+        self.client = client
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+
+    async def sample(self):
+        if self.pid is not None:
+            return _tree_rss(self.pid)
+        response = await self.client.get("/memory/", params={"models": "false"})
+        return response.json()["process"]["rss"]
+
+    async def run(self):
+        while True:
+            try:
+                self.peak = max(self.peak, await self.sample())
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+
+async def run_scenario(client, path, payload, requests, concurrency, warmup, sampler, params=None):
+    for i in range(warmup):
+        await client.post(path, json=payload(i), params=params)
+
+    latencies = []
+    sizes = []
+    status_counts = {}
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload(i), params=params)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(response.content))
+            status_counts[response.status_code] = status_counts.get(response.status_code, 0) + 1
+            # Endpoints report failures as {"error": ...} with a 200
+            if response.status_code != 200 or (
+                response.headers.get("content-type", "").startswith("application/json") and "error" in response.json()
+            ):
+                errors += 1
+
+    sampler.peak = 0
+    sampling = asyncio.create_task(sampler.run())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampling.cancel()
+
+    latencies = np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        "requests": requests,
+        "errors": errors,
+        "status_counts": {str(code): count for code, count in sorted(status_counts.items())},
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_ms": {
+            "mean": round(float(np.mean(latencies)), 3),
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+            "max": round(float(np.max(latencies)), 3),
+        },
+        "response_bytes": round(float(np.mean(sizes)), 1) if sizes else 0.0,
+        "peak_rss_bytes": sampler.peak,
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _wait_ready(client, process=None, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode} during startup")
+        try:
+            if (await client.get("/ready/")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("The server did not become ready in time")
+
+
+def start_servers(args):
+    """Starts the mock weather upstream and the API; returns (base URL, [processes])."""
+    weather_port, api_port = _free_port(), _free_port()
+    weather = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "mock_weather_server:app", "--port", str(weather_port), "--log-level", "warning"],
+        env={**os.environ, "MOCK_WEATHER_LATENCY_MS": str(args.weather_latency_ms)},
+    )
+    env = {
+        **os.environ,
+        "WEATHER_API_BASE_URL": f"http://127.0.0.1:{weather_port}/v1",
+        "WEATHER_API_KEY": "mock",
+        **dict(item.split("=", 1) for item in args.server_env),
+    }
+    if args.workers > 1:
+        command = [sys.executable, "serve.py", "--workers", str(args.workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app"]
+    api = subprocess.Popen(command + ["--port", str(api_port), "--log-level", "warning"], env=env)
+    return f"http://127.0.0.1:{api_port}", [api, weather]
+
+
+async def benchmark(args):
+    processes = []
+    url = args.url
+    if url is None:
+        url, processes = start_servers(args)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        # Endpoints without a `format` parameter ignore it
+        params = {"format": args.format} if args.format != "records" else None
+        headers = {"accept": args.accept} if args.accept else None
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits, headers=headers) as client:
+            await _wait_ready(client, processes[0] if processes else None)
+            sampler = RssSampler(client, pid=processes[0].pid if processes else None)
+            scenarios = _scenarios(args.image)
+            results = {}
+            for name in args.scenarios:
+                path, payload = scenarios[name]
+                results[name] = await run_scenario(
+                    client, path, payload, args.requests, args.concurrency, args.warmup, sampler, params,
+                )
+                latency = results[name]["latency_ms"]
+                print(f"{name:16} {results[name]['throughput_rps']:9.1f} req/s  p50 {latency['p50']:8.2f} ms  "
+                      f"p95 {latency['p95']:8.2f} ms  p99 {latency['p99']:8.2f} ms  "
+                      f"{results[name]['response_bytes']:9.0f} B  errors {results[name]['errors']}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "url": args.url or "local",
+            "workers": args.workers,
+            "server_env": args.server_env,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "format": args.format,
+            "accept": args.accept,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "client_rss_bytes": current_rss(),
+        },
+        "results": results,
+        "peak_rss_bytes": max((result["peak_rss_bytes"] for result in results.values()), default=0),
+    }
+
+
+def _encoding_payloads():
+    """name -> {encoding: build-and-encode function}, for payloads shaped like the real responses."""
+    from fastapi.encoders import jsonable_encoder
+
+    from mock_weather_server import _forecast_day
+    from serialization import dumps, msgpack, pack, series_payload
+    from weather_client import columnar_forecast, summarize_forecast
+
+    rng = np.random.default_rng(0)
+    crops = ["Wheat", "Rice", "Maize", "Soybean", "Cotton", "Gram", "Mustard", "Onion"]
+    dates = pd.date_range("2025-01-05", periods=52, freq="7D")
+    # The rollout used to be inverse-scaled in float32
+    prices = (1000 + rng.random((5, 52, len(crops))) * 2000).astype(np.float32)
+    today = datetime.date(2025, 1, 1)
+    summary = summarize_forecast({"forecast": {"forecastday": [
+        _forecast_day("Indore", today + datetime.timedelta(days=i)) for i in range(14)
+    ]}})
+
+    def market(response_format, scenarios):
+        columns = [{crop: prices[s, :, i] for i, crop in enumerate(crops)} for s in range(scenarios)]
+        if response_format == "before":
+            frames = [pd.DataFrame(prices[s], index=dates, columns=crops).round(2).to_dict() for s in range(scenarios)]
+            return frames[0] if scenarios == 1 else dict(enumerate(frames))
+        payloads = [series_payload(response_format, dates, c) for c in columns]
+        return payloads[0] if scenarios == 1 else dict(enumerate(payloads))
+
+    builders = {
+        "market_forecast (52 wk, 8 crops)": lambda fmt: {"forecast": market(fmt, 1)},
+        "market_scenarios (5 x 52 wk)": lambda fmt: {"forecast": market(fmt, 5)},
+        "weather (14 days)": lambda fmt: {
+            "forecast": columnar_forecast(summary) if fmt == "compact" else summary,
+        },
+    }
+    encodings = {
+        "json records (before)": lambda build: json.dumps(jsonable_encoder(build("before"))).encode(),
+        "orjson records": lambda build: dumps(build("records")),
+        "orjson compact": lambda build: dumps(build("compact")),
+    }
+    if msgpack is not None:
+        encodings["msgpack compact"] = lambda build: pack(build("compact"))
+    return {
+        name: {encoding: (lambda encode=encode, build=build: encode(build)) for encoding, encode in encodings.items()}
+        for name, build in builders.items()
+    }
+
+
+def compare_encodings(repeat):
+    """Prints the size and time to build and encode each payload in each encoding."""
+    print(f"{'payload':34} {'encoding':22} {'bytes':>9} {'us':>9}")
+    for name, encodings in _encoding_payloads().items():
+        for encoding, render in encodings.items():
+            size = len(render())
+            started = time.perf_counter()
+            for _ in range(repeat):
+                render()
+            elapsed_us = (time.perf_counter() - started) / repeat * 1e6
+            print(f"{name:34} {encoding:22} {size:9d} {elapsed_us:9.1f}")
+
+
+def compare(base, head, threshold):
+    """Prints per-scenario changes; returns the scenarios that regressed by more than `threshold` percent."""
+    regressions = []
+    print(f"{'scenario':16} {'metric':14} {'base':>12} {'head':>12} {'change':>9}")
+    for name, head_result in head["results"].items():
+        base_result = base["results"].get(name)
+        if base_result is None:
+            print(f"{name:16} (new scenario)")
+            continue
+        metrics = [(f"{p} ms", base_result["latency_ms"][p], head_result["latency_ms"][p], 1) for p in ("p50", "p95", "p99")]
+        metrics.append(("throughput", base_result["throughput_rps"], head_result["throughput_rps"], -1))
+        metrics.append(("peak RSS MB", base_result["peak_rss_bytes"] / 1e6, head_result["peak_rss_bytes"] / 1e6, 1))
+        if "response_bytes" in base_result and "response_bytes" in head_result:
+            metrics.append(
+                ("response KB", base_result["response_bytes"] / 1e3, head_result["response_bytes"] / 1e3, 1),
+            )
+        for metric, old, new, worse_direction in metrics:
+            change = (new - old) / old * 100 if old else 0.0
+            flag = ""
+            if change * worse_direction > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name} {metric}")
+            print(f"{name:16} {metric:14} {old:12.2f} {new:12.2f} {change:+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CROPIX API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the benchmark and save the results")
+    run.add_argument("--url", help="benchmark a running server instead of starting one")
+    run.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    run.add_argument("--warmup", type=int, default=20)
+    run.add_argument("--timeout", type=float, default=60)
+    run.add_argument("--workers", type=int, default=1, help="start the API with serve.py and this many workers")
+    run.add_argument("--server-env", nargs="*", default=[], metavar="KEY=VALUE",
+                     help="extra environment for the started API, e.g. DISEASE_BACKEND=tflite")
+    run.add_argument("--weather-latency-ms", type=float, default=50, help="artificial mock upstream latency")
+    run.add_argument("--image", default="Leaf_img.jpg", help="image sent to /detect_disease/")
+    run.add_argument("--format", choices=("records", "compact"), default="records",
+                     help="response format requested from the forecast endpoints")
+    run.add_argument("--accept", help="Accept header, e.g. application/msgpack")
+    run.add_argument("--output", help=f"results file (default: {BENCHMARK_DIR}/<commit>.json)")
+    diff = commands.add_parser("compare", help="compare two result files")
+    diff.add_argument("base")
+    diff.add_argument("head")
+    diff.add_argument("--threshold", type=float, default=10, help="percent change counted as a regression")
+    encodings = commands.add_parser("serialization", help="compare response encodings on typical payloads")
+    encodings.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "serialization":
+        compare_encodings(args.repeat)
+        return
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.head) as f:
+            head = json.load(f)
+        regressions = compare(base, head, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold}%: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    report = asyncio.run(benchmark(args))
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
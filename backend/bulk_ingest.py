@@ -0,0 +1,342 @@
+"""Streaming ingestion of many images in one upload (ZIP archive or multipart form).
+
+Images are pulled out of the request body as it arrives, without buffering the
+whole upload: `iter_zip_entries` walks ZIP local file headers and inflates each
+entry on the fly, and `iter_multipart_files` runs python-multipart's push
+parser over the body chunks. `screen_images` then decodes entries in parallel,
+groups them into fixed-size model batches and yields per-image results while
+the rest of the upload is still being received.
+"""
+import asyncio
+import os
+import struct
+import zlib
+from collections import deque
+
+from fastapi.responses import StreamingResponse
+from multipart.multipart import MultipartParser, parse_options_header
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".gif", ".tif", ".tiff"}
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = 0x04034B50
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_CENTRAL_DIRECTORY_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+_ZIP64_EXTRA_ID = 0x0001
+
+
+class UploadError(ValueError):
+    """Raised for archives or form bodies that can't be read."""
+
+
+def is_image_name(name):
+    base = os.path.basename(name)
+    # Skip macOS resource forks and hidden files that ride along in zipped folders
+    if not base or base.startswith(".") or "__MACOSX/" in name:
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+
+class _ChunkReader:
+    """Exact-size reads on top of an async iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._exhausted = False
+
+    async def _fill(self):
+        if self._exhausted:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._exhausted = True
+            return False
+        self._buffer += chunk
+        return True
+
+    async def read(self, size):
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise UploadError("The ZIP archive ended unexpectedly.")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read_some(self):
+        """Whatever is buffered, or the next chunk; b"" at the end of the stream."""
+        if not self._buffer and not await self._fill():
+            return b""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def unread(self, data):
+        self._buffer[:0] = data
+
+
+def _zip64_sizes(extra, compressed_size, size):
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, field_size = struct.unpack_from("<HH", extra, offset)
+        if field_id == _ZIP64_EXTRA_ID:
+            # Only the fields that overflowed in the header are present, in this order
+            expected = (size == 0xFFFFFFFF) + (compressed_size == 0xFFFFFFFF)
+            if field_size < 8 * expected or offset + 4 + field_size > len(extra):
+                raise UploadError("The ZIP archive has a malformed zip64 extra field.")
+            values = iter(struct.unpack_from(f"<{expected}Q", extra, offset + 4))
+            if size == 0xFFFFFFFF:
+                size = next(values)
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = next(values)
+            return compressed_size, size, True
+        offset += 4 + field_size
+    return compressed_size, size, False
+
+
+def _inflate(data, max_size, name):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    try:
+        output = decompressor.decompress(data, max_size + 1)
+    except zlib.error as e:
+        raise UploadError(f"'{name}' is corrupt: {e}") from None
+    if len(output) > max_size:
+        raise UploadError(f"'{name}' is larger than the {max_size} byte limit.")
+    return output
+
+
+async def _inflate_until_end(reader, max_size):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    output = bytearray()
+    while not decompressor.eof:
+        data = await reader.read_some()
+        if not data:
+            raise UploadError("The ZIP archive ended inside a compressed entry.")
+        try:
+            # Bounded so a highly compressed chunk can't inflate far past the limit
+            output += decompressor.decompress(data, max_size - len(output) + 1)
+        except zlib.error as e:
+            raise UploadError(f"An entry is corrupt: {e}") from None
+        if len(output) > max_size:
+            raise UploadError(f"An entry is larger than the {max_size} byte limit.")
+        # Input held back by the bound is fed in again on the next pass
+        reader.unread(decompressor.unconsumed_tail)
+    reader.unread(decompressor.unused_data)
+    return bytes(output)
+
+
+async def _read_stored_until_descriptor(reader, max_size, zip64):
+    # A stored entry with a trailing descriptor has no end marker of its own: look
+    # for a descriptor signature whose recorded size and CRC match the bytes so far.
+    size_format = "<IQQ" if zip64 else "<III"
+    descriptor_size = 4 + struct.calcsize(size_format)
+    data = bytearray()
+    search_from = 0
+    while True:
+        position = data.find(_DATA_DESCRIPTOR_SIGNATURE, search_from)
+        if position >= 0 and len(data) >= position + descriptor_size:
+            crc, compressed_size, _ = struct.unpack_from(size_format, data, position + 4)
+            if compressed_size == position and crc == zlib.crc32(data[:position]):
+                reader.unread(data[position + descriptor_size:])
+                return bytes(data[:position])
+            search_from = position + 1
+            continue
+        if len(data) > max_size + descriptor_size:
+            raise UploadError(f"An entry is larger than the {max_size} byte limit.")
+        chunk = await reader.read_some()
+        if not chunk:
+            raise UploadError("The ZIP archive ended inside a stored entry.")
+        data += chunk
+
+
+async def iter_zip_entries(chunks, max_entry_size):
+    """Yields (name, bytes) for every file in a ZIP streamed as `chunks`.
+
+    Only the local file headers are used, so entries are available as soon as
+    their data has arrived; the central directory at the end is ignored.
+    Stored and deflated entries are supported, including ones whose sizes are
+    only given in a trailing data descriptor (as written by streaming zippers).
+    """
+    reader = _ChunkReader(chunks)
+    while True:
+        signature = await reader.read_some()
+        if not signature:
+            return
+        reader.unread(signature)
+        signature = await reader.read(4)
+        if signature in _CENTRAL_DIRECTORY_SIGNATURES:
+            return
+        if struct.unpack("<I", signature)[0] != _LOCAL_HEADER_SIGNATURE:
+            raise UploadError("Not a ZIP archive, or it is corrupt.")
+        header = signature + await reader.read(_LOCAL_HEADER.size - 4)
+        (_, _, flags, method, _, _, _, compressed_size, size, name_length,
+         extra_length) = _LOCAL_HEADER.unpack(header)
+        name = (await reader.read(name_length)).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = await reader.read(extra_length)
+        compressed_size, size, zip64 = _zip64_sizes(extra, compressed_size, size)
+        if flags & 0x1:
+            raise UploadError(f"'{name}' is encrypted.")
+        if method not in (0, 8):
+            raise UploadError(f"'{name}' uses an unsupported compression method ({method}).")
+
+        if flags & 0x8 and method == 0:
+            data = await _read_stored_until_descriptor(reader, max_entry_size, zip64)
+        elif flags & 0x8:
+            # Sizes follow the data, so the deflate stream itself has to tell us where it ends
+            data = await _inflate_until_end(reader, max_entry_size)
+            descriptor = await reader.read(4)
+            if descriptor != _DATA_DESCRIPTOR_SIGNATURE:
+                reader.unread(descriptor)  # the signature is optional
+            await reader.read(4 + (16 if zip64 else 8))
+        else:
+            # The header sizes come from the uploader, so the inflated output is bounded too
+            if size > max_entry_size or compressed_size > max_entry_size:
+                raise UploadError(f"'{name}' is larger than the {max_entry_size} byte limit.")
+            data = await reader.read(compressed_size)
+            if method == 8:
+                data = _inflate(data, max_entry_size, name)
+            if len(data) != size:
+                raise UploadError(f"'{name}' does not match the size in its header.")
+
+        if not name.endswith("/"):
+            yield name, data
+
+
+async def iter_multipart_files(chunks, content_type, max_entry_size):
+    """Yields (filename, bytes) for every file part of a multipart/form-data body, as parts complete."""
+    _, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise UploadError("The multipart body has no boundary.")
+
+    completed = deque()
+    part = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, data=bytearray())
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part["headers"][bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_part_data(data, start, end):
+        part["data"] += data[start:end]
+        if len(part["data"]) > max_entry_size:
+            raise UploadError(f"A file is larger than the {max_entry_size} byte limit.")
+
+    def on_part_end():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        filename = disposition.get(b"filename")
+        if filename is not None:
+            completed.append((filename.decode("utf-8", "replace"), bytes(part["data"])))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    async for chunk in chunks:
+        parser.write(chunk)
+        while completed:
+            yield completed.popleft()
+    parser.finalize()
+    while completed:
+        yield completed.popleft()
+
+
+async def screen_images(entries, decode, predict_batch, batch_size, max_images, max_pending_predicts=2):
+    """Decodes entries in parallel and classifies them in batches of `batch_size`, yielding result dicts.
+
+    `decode(bytes)` and `predict_batch(images)` are coroutine functions (the
+    caller decides which executor they run on). Decoding happens while later
+    entries are still arriving; at most two batches' worth of images are
+    decoded ahead of the model, which bounds memory for arbitrarily large uploads.
+    Each result carries the image's upload `index` and `name`. Batches come out
+    in upload order, but a decode failure is reported as soon as it's found
+    (with an `error` instead of a prediction), ahead of its batch.
+    """
+    decoding = deque()
+    predicting = deque()
+    batch = []
+
+    async def classify(items):
+        try:
+            predictions = await predict_batch([image for _, _, image in items])
+        except Exception as e:
+            return [{"index": index, "name": name, "error": str(e)} for index, name, _ in items]
+        return [
+            {"index": index, "name": name, "predicted_disease": predicted, "confidence": confidence}
+            for (index, name, _), (predicted, confidence) in zip(items, predictions)
+        ]
+
+    async def take_decoded():
+        index, name, task = decoding.popleft()
+        try:
+            batch.append((index, name, await task))
+        except Exception as e:
+            return [{"index": index, "name": name, "error": f"Could not decode image: {e}"}]
+        if len(batch) == batch_size:
+            predicting.append(asyncio.ensure_future(classify(batch[:])))
+            batch.clear()
+        return []
+
+    try:
+        count = 0
+        async for name, data in entries:
+            if not is_image_name(name):
+                continue
+            if count >= max_images:
+                raise UploadError(f"Uploads are limited to {max_images} images.")
+            decoding.append((count, name, asyncio.ensure_future(decode(data))))
+            count += 1
+
+            # Move finished decodes into the batch, waiting only when too far ahead of the model
+            while decoding and (decoding[0][2].done() or len(decoding) >= 2 * batch_size):
+                for result in await take_decoded():
+                    yield result
+            while predicting and (predicting[0].done() or len(predicting) > max_pending_predicts):
+                for result in await predicting.popleft():
+                    yield result
+
+        while decoding:
+            for result in await take_decoded():
+                yield result
+        if batch:
+            predicting.append(asyncio.ensure_future(classify(batch[:])))
+        while predicting:
+            for result in await predicting.popleft():
+                yield result
+    finally:
+        for _, _, task in decoding:
+            task.cancel()
+        for task in predicting:
+            task.cancel()
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse that can start sending while the request body is still being read.
+
+    The stock StreamingResponse listens for client disconnects by calling
+    `receive()` alongside the body iterator, which would steal body chunks from
+    an endpoint still consuming `request.stream()`; here the body iterator owns
+    `receive()` and a disconnect surfaces as ClientDisconnect from the stream.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,24 @@
+import asyncio
+
+
+class InflightRequests:
+    """One task per key at a time: concurrent callers for a key share the task already running."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    def __contains__(self, key):
+        return key in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def run(self, key, start):
+        """Awaits the task in flight for `key`, starting `start()` (a coroutine function) if there is none."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(start())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # Shielded so one caller disconnecting doesn't cancel the work for the rest
+        return await asyncio.shield(task)
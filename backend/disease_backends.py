@@ -0,0 +1,229 @@
+"""Interchangeable inference backends for the disease detection CNN.
+
+`keras` runs the original .h5 model; `tflite` runs a converted (optionally
+quantized) copy of it through the TFLite interpreter, which has far less
+per-call overhead on CPU. Both take a float32 (batch, height, width, 3) tensor
+scaled to [0, 1] and return class probabilities.
+
+    python disease_backends.py export --quantization int8 --calibration-dir <images>
+    python disease_backends.py evaluate --images-dir <held-out images> --backends keras tflite
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DISEASE_BACKENDS = ("keras", "tflite")
+QUANTIZATION_MODES = ("none", "float16", "dynamic", "int8")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def _tflite_interpreter_class():
+    # The standalone LiteRT runtime is preferred when installed; TensorFlow's copy is deprecated
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+
+        return tf.lite.Interpreter
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def load(cls, model_path):
+        from tensorflow.keras.models import load_model # type: ignore
+
+        return cls(load_model(model_path))
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteBackend:
+    """Runs a .tflite export, resizing the interpreter's input only when the batch size changes.
+
+    Quantized integer inputs/outputs are (de)quantized here, so callers always
+    deal in float32 images and probabilities.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = _tflite_interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter holds per-invocation state and is not thread-safe
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_path, num_threads=None):
+        return cls(model_path, num_threads)
+
+    def _resize(self, batch_size):
+        shape = list(self._input["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._resize(len(batch))
+            dtype = self._input["dtype"]
+            if dtype != np.float32:
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+        if output.dtype != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def export_tflite(keras_model, output_path, quantization="float16", calibration_images=None):
+    """Converts the Keras CNN to TFLite and returns the size of the written file in bytes.
+
+    `float16` halves the weights, `dynamic` stores int8 weights with float
+    activations, and `int8` also quantizes activations using
+    `calibration_images` (float32 arrays in [0, 1]); the model's inputs and
+    outputs stay float32 in every mode.
+    """
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization must be one of {', '.join(QUANTIZATION_MODES)}")
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if calibration_images is None or not len(calibration_images):
+            raise ValueError("int8 quantization needs calibration images")
+        converter.representative_dataset = lambda: ([image[np.newaxis]] for image in calibration_images)
+    exported = converter.convert()
+    with open(output_path, "wb") as f:
+        f.write(exported)
+    return len(exported)
+
+
+def load_image_folder(images_dir, per_class=None):
+    """Loads `images_dir/<class name>/<image>` into a float32 [0, 1] array plus class names.
+
+    `per_class` caps the number of images taken from each class folder.
+    """
+    from image_preprocessing import decode_image
+
+    images, labels = [], []
+    for label in sorted(os.listdir(images_dir)):
+        class_dir = os.path.join(images_dir, label)
+        if not os.path.isdir(class_dir):
+            continue
+        filenames = [name for name in sorted(os.listdir(class_dir))
+                     if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+        for filename in filenames[:per_class]:
+            with open(os.path.join(class_dir, filename), "rb") as f:
+                images.append(decode_image(f.read()))
+            labels.append(label)
+    if not images:
+        raise ValueError(f"No images found under {images_dir}/<class name>/")
+    return np.stack(images).astype(np.float32) / 255.0, labels
+
+
+def evaluate_backend(backend, images, labels, classes, batch_size=32):
+    """Accuracy against the folder labels plus single-image and batched latency."""
+    backend.predict(images[:1])  # warm-up for both the single-image and batched shapes
+    backend.predict(images[:batch_size])
+
+    single_ms = []
+    for image in images[:min(len(images), 100)]:
+        start = time.perf_counter()
+        backend.predict(image[np.newaxis])
+        single_ms.append((time.perf_counter() - start) * 1000)
+
+    probabilities = []
+    start = time.perf_counter()
+    for offset in range(0, len(images), batch_size):
+        probabilities.append(backend.predict(images[offset:offset + batch_size]))
+    batched_seconds = time.perf_counter() - start
+
+    probabilities = np.concatenate(probabilities)
+    predicted = [str(classes[index]) for index in np.argmax(probabilities, axis=1)]
+    return {
+        "accuracy": float(np.mean([p == label for p, label in zip(predicted, labels)])),
+        "single_image_ms_p50": float(np.percentile(single_ms, 50)),
+        "single_image_ms_p95": float(np.percentile(single_ms, 95)),
+        "batched_images_per_second": len(images) / batched_seconds,
+        "probabilities": probabilities,
+    }
+
+
+def compare_backends(backends, images, labels, classes, batch_size=32):
+    """Evaluates each backend; deltas are relative to the first (reference) backend."""
+    report = {}
+    reference = None
+    for backend in backends:
+        result = evaluate_backend(backend, images, labels, classes, batch_size)
+        probabilities = result.pop("probabilities")
+        if reference is None:
+            reference = (result, probabilities)
+        else:
+            baseline, baseline_probabilities = reference
+            result["accuracy_delta"] = result["accuracy"] - baseline["accuracy"]
+            result["top1_agreement"] = float(np.mean(
+                np.argmax(probabilities, axis=1) == np.argmax(baseline_probabilities, axis=1)
+            ))
+            result["max_probability_delta"] = float(np.max(np.abs(probabilities - baseline_probabilities)))
+            result["single_image_speedup"] = baseline["single_image_ms_p50"] / result["single_image_ms_p50"]
+            result["batched_speedup"] = result["batched_images_per_second"] / baseline["batched_images_per_second"]
+        report[backend.name] = result
+    return report
+
+
+if __name__ == "__main__":
+    from main import DISEASE_CLASSES_PATH, DISEASE_MODEL_PATH, DISEASE_TFLITE_PATH, DISEASE_TFLITE_THREADS
+
+    parser = argparse.ArgumentParser(description="Export and evaluate disease detection backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="convert the Keras CNN to TFLite")
+    export.add_argument("--quantization", choices=QUANTIZATION_MODES, default="float16")
+    export.add_argument("--calibration-dir", help="image folder used to calibrate int8 quantization")
+    export.add_argument("--calibration-per-class", type=int, default=20)
+    export.add_argument("--output", default=DISEASE_TFLITE_PATH)
+    evaluate = commands.add_parser("evaluate", help="compare backends on a held-out image folder")
+    evaluate.add_argument("--images-dir", required=True, help="folder laid out as <class name>/<image>")
+    evaluate.add_argument("--backends", nargs="+", choices=DISEASE_BACKENDS, default=list(DISEASE_BACKENDS))
+    evaluate.add_argument("--tflite-path", default=DISEASE_TFLITE_PATH)
+    evaluate.add_argument("--batch-size", type=int, default=32)
+    evaluate.add_argument("--per-class", type=int, help="cap on images evaluated per class")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        calibration = None
+        if args.calibration_dir:
+            calibration, _ = load_image_folder(args.calibration_dir, args.calibration_per_class)
+        size = export_tflite(KerasBackend.load(DISEASE_MODEL_PATH).model, args.output, args.quantization, calibration)
+        print(f"Wrote {args.output} ({size / 1e6:.1f} MB, {args.quantization})")
+    else:
+        classes = np.load(DISEASE_CLASSES_PATH, allow_pickle=True)
+        images, labels = load_image_folder(args.images_dir, args.per_class)
+        backends = [
+            KerasBackend.load(DISEASE_MODEL_PATH) if name == "keras"
+            else TFLiteBackend.load(args.tflite_path, DISEASE_TFLITE_THREADS)
+            for name in args.backends
+        ]
+        print(json.dumps(compare_backends(backends, images, labels, classes, args.batch_size), indent=2))
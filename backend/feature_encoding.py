@@ -0,0 +1,286 @@
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+logger = logging.getLogger(__name__)
+
+# The fast path deliberately feeds plain arrays to estimators fitted on DataFrames
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+class UnsupportedModel(Exception):
+    """Raised when a model's preprocessing can't be compiled into a FeatureEncoder."""
+
+
+def _is_passthrough(transformer):
+    if isinstance(transformer, str):
+        return transformer == 'passthrough'
+    # Fitted ColumnTransformers store a passthrough remainder as an identity FunctionTransformer
+    return isinstance(transformer, FunctionTransformer) and transformer.func is None
+
+
+def _column_names(columns, feature_names):
+    if isinstance(columns, str):
+        return [columns]
+    columns = list(columns)
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [name for name, keep in zip(feature_names, columns) if keep]
+    if columns and isinstance(columns[0], (int, np.integer)):
+        return [feature_names[index] for index in columns]
+    return columns
+
+
+def fitted_categories(model):
+    """`{column: set of categories}` for every one-hot encoded column of a pipeline's ColumnTransformer."""
+    steps = model.steps if isinstance(model, Pipeline) else [(None, model)]
+    categories = {}
+    for _, step in steps:
+        if not isinstance(step, ColumnTransformer):
+            continue
+        feature_names = list(getattr(step, 'feature_names_in_', []))
+        for _, transformer, columns in step.transformers_:
+            if isinstance(transformer, OneHotEncoder):
+                for column, values in zip(_column_names(columns, feature_names), transformer.categories_):
+                    categories[column] = set(values.tolist())
+    return categories
+
+
+class FeatureEncoder:
+    """Turns one input record into the exact numeric row the final estimator expects.
+
+    Built once per model at load time from the fitted preprocessing (column
+    order, one-hot category offsets, passthrough columns), so a request only
+    fills a fixed-width NumPy row with dictionary lookups instead of building a
+    DataFrame and running the sklearn pipeline.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.numeric = []      # (output position, input column)
+        self.categorical = []  # (input column, {category: output position}, raise_on_unknown)
+        # A ColumnTransformer that emits sparse matrices changes what "0" means
+        # downstream: XGBoost treats implicit sparse zeros as missing values.
+        self.sparse = False
+        self.zero_is_missing = False
+
+    @classmethod
+    def from_model(cls, model):
+        """Compiles an encoder for a bare estimator or a [ColumnTransformer, estimator] pipeline."""
+        if isinstance(model, Pipeline):
+            if len(model.steps) != 2 or not isinstance(model.steps[0][1], ColumnTransformer):
+                raise UnsupportedModel("only [ColumnTransformer, estimator] pipelines are supported")
+            encoder = cls._from_column_transformer(model.steps[0][1])
+            if getattr(model.steps[0][1], 'sparse_output_', False):
+                if type(model.steps[-1][1]).__module__.startswith('xgboost'):
+                    encoder.zero_is_missing = True
+                else:
+                    encoder.sparse = True
+            return encoder
+
+        feature_names = getattr(model, 'feature_names_in_', None)
+        if feature_names is None:
+            raise UnsupportedModel("estimator was not fitted with named features")
+        encoder = cls(len(feature_names))
+        encoder.numeric = list(enumerate(feature_names))
+        return encoder
+
+    @classmethod
+    def _from_column_transformer(cls, transformer):
+        feature_names = list(transformer.feature_names_in_)
+        encoder = cls(0)
+        position = 0
+        for _, step, columns in transformer.transformers_:
+            columns = _column_names(columns, feature_names)
+            if step == 'drop' or not columns:
+                continue
+            if _is_passthrough(step):
+                for column in columns:
+                    encoder.numeric.append((position, column))
+                    position += 1
+            elif isinstance(step, OneHotEncoder):
+                if step.drop is not None or getattr(step, 'infrequent_categories_', None):
+                    raise UnsupportedModel("one-hot encoders with drop/infrequent categories are not supported")
+                for column, categories in zip(columns, step.categories_):
+                    offsets = {category: position + i for i, category in enumerate(categories.tolist())}
+                    encoder.categorical.append((column, offsets, step.handle_unknown == 'error'))
+                    position += len(categories)
+            else:
+                raise UnsupportedModel(f"unsupported transformer {type(step).__name__}")
+        encoder.width = position
+        return encoder
+
+    @property
+    def input_columns(self):
+        return [column for _, column in self.numeric] + [column for column, _, _ in self.categorical]
+
+    def encode(self, record):
+        """Encodes a dict or pydantic model into a (1, width) float64 row."""
+        fields = record if isinstance(record, dict) else record.__dict__
+        row = np.zeros((1, self.width), dtype=np.float64)
+        for position, column in self.numeric:
+            row[0, position] = fields[column]
+        for column, offsets, raise_on_unknown in self.categorical:
+            position = offsets.get(fields[column])
+            if position is not None:
+                row[0, position] = 1.0
+            elif raise_on_unknown:
+                raise ValueError(f"Found unknown category {fields[column]!r} in column {column!r}")
+        if self.zero_is_missing:
+            row[row == 0.0] = np.nan
+        elif self.sparse:
+            return sparse.csr_matrix(row)
+        return row
+
+    def encode_many(self, record, overrides):
+        """Encodes `record` once per row of `overrides` ({numeric column: 1-D array}) into an (n, width) matrix.
+
+        Only the overridden numeric columns vary, so the categorical one-hot
+        part is encoded a single time and tiled.
+        """
+        count = len(next(iter(overrides.values())))
+        base = self.encode({**record, **{column: 0.0 for column in overrides}})
+        rows = np.repeat(base.toarray() if self.sparse else base, count, axis=0)
+        positions = {column: position for position, column in self.numeric}
+        for column, values in overrides.items():
+            if column not in positions:
+                raise ValueError(f"{column!r} is not a numeric input of the model")
+            rows[:, positions[column]] = values
+            if self.zero_is_missing:
+                rows[rows[:, positions[column]] == 0.0, positions[column]] = np.nan
+        return sparse.csr_matrix(rows) if self.sparse else rows
+
+    def sample_records(self, count, seed=0):
+        """Synthetic records cycling through every known category, for parity checks.
+
+        Some numeric values are exactly zero, which is where sparse and dense
+        encodings are most likely to disagree.
+        """
+        rng = np.random.default_rng(seed)
+        records = []
+        for i in range(count):
+            record = {
+                column: 0.0 if (i + j) % 7 == 0 else float(rng.uniform(0, 1000))
+                for j, (_, column) in enumerate(self.numeric)
+            }
+            for column, offsets, _ in self.categorical:
+                categories = list(offsets)
+                record[column] = categories[i % len(categories)]
+            records.append(record)
+        return records
+
+
+class FastPredictor:
+    """Single-record predictions through a FeatureEncoder, falling back to the DataFrame path.
+
+    The fast path is only enabled if it reproduces the DataFrame pipeline's
+    predictions on a set of sample records when the model is loaded.
+    """
+
+    def __init__(self, model, name="model", parity_samples=64):
+        self.model = model
+        self.name = name
+        self.estimator = model.steps[-1][1] if isinstance(model, Pipeline) else model
+        self.categories = fitted_categories(model)
+        try:
+            self.encoder = FeatureEncoder.from_model(model)
+        except UnsupportedModel as e:
+            logger.info("No fast path for %s: %s", name, e)
+            self.encoder = None
+        if self.encoder is not None and parity_samples:
+            mismatches = check_parity(self, self.encoder.sample_records(parity_samples))
+            if mismatches:
+                logger.warning("Fast path for %s disagrees with the pipeline on %d samples; disabled",
+                               name, mismatches)
+                self.encoder = None
+
+    @property
+    def fast_path(self):
+        return self.encoder is not None
+
+    def predict_dataframe(self, record):
+        fields = record if isinstance(record, dict) else record.dict()
+        return self.model.predict(pd.DataFrame([fields]))[0]
+
+    def predict_one(self, record):
+        if self.encoder is None:
+            return self.predict_dataframe(record)
+        return self.estimator.predict(self.encoder.encode(record))[0]
+
+    def check_known(self, record, columns):
+        """Raises ValueError if a value in `columns` is a category the model wasn't fitted on."""
+        for column in columns:
+            known = self.categories.get(column)
+            if known is not None and record[column] not in known:
+                raise ValueError(f"{record[column]!r} is not a {column} the {self.name} model was trained on.")
+
+    def predict_known(self, record, columns):
+        """`predict_one`, but raises ValueError for categories in `columns` the model wasn't fitted on.
+
+        Unknown categories are otherwise encoded as all zeros and still get a prediction.
+        """
+        self.check_known(record, columns)
+        return self.predict_one(record)
+
+    def predict_many(self, record, overrides):
+        """Predicts `record` with each row of `overrides` ({column: 1-D array}) substituted in, as one call."""
+        if self.encoder is None:
+            count = len(next(iter(overrides.values())))
+            frame = pd.DataFrame({**{column: [value] * count for column, value in record.items()}, **overrides})
+            return self.model.predict(frame)
+        return self.estimator.predict(self.encoder.encode_many(record, overrides))
+
+
+def check_parity(predictor, records):
+    """Counts records where the fast path and the DataFrame pipeline disagree."""
+    mismatches = 0
+    for record in records:
+        expected = np.asarray(predictor.predict_dataframe(record))
+        actual = np.asarray(predictor.estimator.predict(predictor.encoder.encode(record))[0])
+        if expected.dtype.kind in 'fc':
+            same = np.allclose(actual, expected, rtol=1e-6, atol=1e-9)
+        else:
+            same = np.array_equal(actual, expected)
+        if not same:
+            mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Parity suite: python feature_encoding.py [samples]
+    import sys
+    import joblib
+
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    failed = []
+    unloaded = []
+    for name, path in [
+        ("crop_yield", 'Trained_models/CROP_YIELD_MODEL.joblib'),
+        ("soil_crop", 'Trained_models/Soil_crop_recom.joblib'),
+        ("fertilizer", 'Trained_models/fertilizer_recommendation_model.joblib'),
+    ]:
+        try:
+            predictor = FastPredictor(joblib.load(path), name, parity_samples=0)
+        except Exception as e:
+            print(f"{name}: could not load model ({e})")
+            unloaded.append(name)
+            continue
+        if not predictor.fast_path:
+            print(f"{name}: no fast path, DataFrame pipeline is used")
+            continue
+        mismatches = check_parity(predictor, predictor.encoder.sample_records(samples, seed=1))
+        print(f"{name}: {samples - mismatches}/{samples} samples match the DataFrame pipeline")
+        if mismatches:
+            failed.append(name)
+    # Non-zero exit on any mismatch or unloadable model, so the suite can gate a model update
+    if failed:
+        print(f"Fast path disagrees with the pipeline for: {', '.join(failed)}")
+    if unloaded:
+        print(f"Could not check: {', '.join(unloaded)}")
+    if failed or unloaded:
+        sys.exit(1)
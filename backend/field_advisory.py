@@ -0,0 +1,58 @@
+"""Builds the per-model inputs of a field advisory from one validated request.
+
+`/field_advisory/` runs the soil crop recommendation first and feeds its crop
+into the fertilizer and yield models, while the weather lookup runs alongside.
+The soil model's labels (lowercase, e.g. "chickpea") don't match the crop
+names the yield model was trained on (e.g. "Gram"), so they are translated
+here once. The yield model's padded `Season` category is normalised by the
+`YieldSeason` field type, shared by every input model that reaches that model.
+"""
+from typing import Annotated
+
+from pydantic import AfterValidator
+
+# Soil recommendation label -> crop name in the yield dataset, where they differ
+# beyond capitalisation. Labels not listed are title-cased.
+YIELD_CROP_NAMES = {
+    "chickpea": "Gram",
+    "pigeonpeas": "Arhar/Tur",
+    "mungbean": "Moong(Green Gram)",
+    "blackgram": "Urad",
+    "lentil": "Masoor",
+    "cotton": "Cotton(lint)",
+    "kidneybeans": "Peas & beans (Pulses)",
+    "mothbeans": "Other Kharif pulses",
+}
+
+SOIL_FEATURES = ("N", "P", "K", "temperature", "humidity", "ph", "rainfall")
+YIELD_FEATURES = ("Season", "Area", "Fertilizer", "Crop_Year", "Pesticide", "Annual_Rainfall")
+
+
+def crop_names(soil_label):
+    """`(fertilizer crop, yield crop)` for a soil recommendation label."""
+    label = str(soil_label).strip().lower()
+    display_name = label.title()
+    return display_name, YIELD_CROP_NAMES.get(label, display_name)
+
+
+def season_category(season):
+    # The yield dataset's seasons are space-padded to 11 characters ("Rabi       ")
+    return f"{season.strip().title():<11}"
+
+
+YieldSeason = Annotated[str, AfterValidator(season_category)]
+
+
+def build_records(fields):
+    """Splits one advisory request into the soil record and a function completing the others with a crop."""
+    soil_record = {name: fields[name] for name in SOIL_FEATURES}
+    yield_fields = {name: fields[name] for name in YIELD_FEATURES}
+
+    def downstream_records(soil_label):
+        fertilizer_crop, yield_crop = crop_names(soil_label)
+        fertilizer_record = {
+            "Crop": fertilizer_crop, "Current_N": fields["N"], "Current_P": fields["P"], "Current_K": fields["K"],
+        }
+        return fertilizer_record, {**soil_record, **yield_fields, "Crop": yield_crop}
+
+    return soil_record, downstream_records
@@ -0,0 +1,178 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+N_STEPS = 8  # This must match the model's training configuration
+
+
+def build_rollout(model, n_steps, n_features):
+    """Compiles the whole autoregressive forecast into a single TensorFlow graph.
+
+    The returned function takes a batch of scaled windows of shape
+    (batch, n_steps, n_features) and a horizon, and returns the scaled
+    predictions of shape (batch, horizon, n_features). Each step calls the model
+    directly and slides its output into the window inside a `tf.while_loop`, so
+    a 52-week forecast is one dispatch instead of 52 `model.predict` calls.
+    """
+    import tensorflow as tf # type: ignore
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([None, n_steps, n_features], tf.float32),
+        tf.TensorSpec([], tf.int32),
+    ])
+    def rollout(windows, horizon):
+        predictions = tf.TensorArray(tf.float32, size=horizon)
+        window = windows
+        for step in tf.range(horizon):
+            prediction = model(window, training=False)
+            predictions = predictions.write(step, prediction)
+            window = tf.concat([window[:, 1:, :], prediction[:, tf.newaxis, :]], axis=1)
+        return tf.transpose(predictions.stack(), [1, 0, 2])
+
+    return rollout
+
+
+def future_dates(last_date, weeks):
+    return pd.date_range(last_date + pd.Timedelta(weeks=1), periods=weeks, freq="7D")
+
+
+class MarketForecaster:
+    """The market LSTM together with the price store whose scaling it was trained against.
+
+    Only the latest `n_steps` weeks are read from the store. When new weeks are
+    appended, the window and scaler are refreshed on the next forecast without
+    reloading the model.
+    """
+
+    def __init__(self, model, price_store, n_steps=N_STEPS):
+        self.model = model
+        self.price_store = price_store
+        self.crops = price_store.crops
+        self.n_steps = n_steps
+        self.n_features = len(self.crops)
+        self._state = None  # (revision, scaler, last_window, last_date)
+        self.rollout = build_rollout(model, n_steps, self.n_features)
+
+    @classmethod
+    def load(cls, model_path, price_store, n_steps=N_STEPS):
+        from tensorflow.keras.models import load_model # type: ignore
+
+        return cls(load_model(model_path), price_store, n_steps)
+
+    def state(self):
+        """`(revision, scaler, last_window, last_date)` for the store's current revision."""
+        window = self.price_store.window(self.n_steps)
+        state = self._state
+        if state is None or state[0] != window.revision:
+            scaler = window.scaler()
+            state = self._state = (window.revision, scaler, scaler.transform(window.prices), window.last_date)
+        return state
+
+    @property
+    def revision(self):
+        return self.state()[0]
+
+    @property
+    def scaler(self):
+        return self.state()[1]
+
+    @property
+    def last_window(self):
+        return self.state()[2]
+
+    @property
+    def last_date(self):
+        return self.state()[3]
+
+    def warm_up(self):
+        """Runs a one-step rollout so graph tracing happens before the first request."""
+        self.rollout_scaled(self.last_window[np.newaxis], 1)
+
+    def rollout_scaled(self, windows, horizon):
+        """Forecasts `horizon` steps for each scaled window in one batched call."""
+        windows = np.asarray(windows, dtype=np.float32)
+        return self.rollout(windows, np.int32(horizon)).numpy()
+
+    def forecast_prices(self, windows, horizon, scaler=None):
+        """Like `rollout_scaled`, but returns prices in the original units."""
+        scaler = scaler or self.scaler
+        # Inverse-scaled in float64: float32 prices carry noise like 2073.510009765625 into the responses
+        scaled = self.rollout_scaled(windows, horizon).astype(np.float64)
+        flat = scaler.inverse_transform(scaled.reshape(-1, self.n_features))
+        return flat.reshape(scaled.shape)
+
+    def forecast(self, weeks_to_forecast):
+        """Forecasts every crop `weeks_to_forecast` weeks past the end of the history."""
+        _, scaler, last_window, last_date = self.state()
+        forecast_prices = self.forecast_prices(last_window[np.newaxis], weeks_to_forecast, scaler)[0]
+        return pd.DataFrame(forecast_prices, index=future_dates(last_date, weeks_to_forecast), columns=self.crops)
+
+    def forecast_scenarios(self, weeks_to_forecast, shocks):
+        """Forecasts every crop under each what-if scenario in one batched rollout.
+
+        `shocks` holds one `{crop: fractional change}` dict per scenario, applied
+        to the latest week's prices (`{"Wheat": -0.1}` starts from a 10% lower
+        wheat price); an empty dict is the baseline. Returns the forecast dates
+        and a (scenario, week, crop) array of prices.
+        """
+        _, scaler, last_window, last_date = self.state()
+        multipliers = np.ones((len(shocks), self.n_features))
+        for row, shock in zip(multipliers, shocks):
+            for crop, change in shock.items():
+                row[self.crops.index(crop)] += change
+        # Shocks are applied in price units, then the shocked week is rescaled
+        windows = np.repeat(last_window[np.newaxis], len(shocks), axis=0)
+        latest = scaler.inverse_transform(last_window[-1:]) * multipliers
+        windows[:, -1, :] = scaler.transform(latest)
+        return future_dates(last_date, weeks_to_forecast), self.forecast_prices(windows, weeks_to_forecast, scaler)
+
+
+class ForecastCache:
+    """Caches the all-crops forecast for the longest horizon requested so far.
+
+    Any `crop_name` / `weeks_to_forecast` request is answered by slicing that
+    one forecast. The entry is keyed on the model version and price store
+    revision, so newly appended weeks or a changed `lstm_model.keras` force a
+    fresh rollout.
+    """
+
+    def __init__(self, min_horizon=52):
+        self.min_horizon = min_horizon
+        self.hits = 0
+        self.misses = 0
+        self._entry = (None, None)  # (fingerprint, forecast), swapped as one object
+        self._lock = threading.Lock()
+
+    def _lookup(self, fingerprint, weeks_to_forecast):
+        cached_fingerprint, forecast = self._entry
+        if cached_fingerprint == fingerprint and forecast is not None and len(forecast) >= weeks_to_forecast:
+            return forecast.iloc[:weeks_to_forecast]
+        return None
+
+    def get(self, forecaster, fingerprint, weeks_to_forecast):
+        forecast = self._lookup(fingerprint, weeks_to_forecast)
+        if forecast is None:
+            with self._lock:
+                # Concurrent misses for the same fingerprint share one rollout.
+                forecast = self._lookup(fingerprint, weeks_to_forecast)
+                if forecast is None:
+                    self.misses += 1
+                    cached_fingerprint, cached = self._entry
+                    horizon = max(weeks_to_forecast, self.min_horizon)
+                    if cached_fingerprint == fingerprint and cached is not None:
+                        horizon = max(horizon, len(cached))
+                    full = forecaster.forecast(horizon)
+                    self._entry = (fingerprint, full)
+                    return full.iloc[:weeks_to_forecast]
+        self.hits += 1
+        return forecast
+
+    def stats(self):
+        fingerprint, forecast = self._entry
+        return {
+            "fingerprint": fingerprint,
+            "cached_weeks": 0 if forecast is None else len(forecast),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
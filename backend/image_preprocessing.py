@@ -0,0 +1,42 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# Input resolution of the disease detection CNN (width, height)
+DISEASE_IMAGE_SIZE = (256, 256)
+
+
+def decode_image(image_bytes, target_size=DISEASE_IMAGE_SIZE):
+    """Decodes an encoded image (PNG, JPEG, ...) into a uint8 RGB array of `target_size`.
+
+    Mirrors `tf.keras.preprocessing.image.load_img(path, target_size=...)`:
+    convert to RGB first, then nearest-neighbour resize, so predictions match
+    the previous save-to-disk-and-reload pipeline.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != target_size:
+            image = image.resize(target_size, Image.NEAREST)
+        return np.asarray(image, dtype=np.uint8)
+
+
+class BatchBuffer:
+    """Preallocated float32 input tensor the CNN batches are normalized into.
+
+    Used as the batcher's `collate_fn`: each decoded uint8 image is scaled to
+    [0, 1] straight into its slot, so no per-request float arrays or
+    `np.stack` copies are made. The returned view is only valid until the next
+    call, which is fine because the batcher runs one batch at a time.
+    """
+
+    def __init__(self, max_batch_size, target_size=DISEASE_IMAGE_SIZE, channels=3):
+        width, height = target_size
+        self.buffer = np.empty((max_batch_size, height, width, channels), dtype=np.float32)
+
+    def __call__(self, images):
+        batch = self.buffer[:len(images)]
+        for slot, image in zip(batch, images):
+            np.divide(image, 255.0, out=slot, dtype=np.float32)
+        return batch
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Predictors reachable from predict_tabular. In-process, main.py points the
+# lookup at its model registry; process-pool workers fill this dict through
+# load_tabular_predictors.
+TABULAR_PREDICTORS = {}
+_get_predictor = TABULAR_PREDICTORS.__getitem__
+
+
+def use_predictor_source(get_predictor):
+    """Makes predict_tabular resolve predictors through `get_predictor(name)`."""
+    global _get_predictor
+    _get_predictor = get_predictor
+
+
+def load_tabular_predictors(model_paths, mmap_mode=None):
+    """Process-pool initializer: loads each tabular model once per worker process."""
+    import joblib
+    from feature_encoding import FastPredictor
+
+    for name, path in model_paths.items():
+        # A broken artifact must not take the whole pool down with it
+        try:
+            TABULAR_PREDICTORS[name] = FastPredictor(joblib.load(path, mmap_mode=mmap_mode), name)
+        except Exception:
+            logger.exception("Worker %d could not load %s", os.getpid(), name)
+
+
+def predict_tabular(name, method, payload):
+    """Runs a tabular prediction; picklable so it works on thread and process pools alike.
+
+    `method` is "one" for a single record dict, "frame" for a DataFrame chunk
+    (returns a plain list of predictions), "known" for a `(record, columns)`
+    pair that must only use categories the model was fitted on in `columns`,
+    "check" to run only that category check, or "many" for a
+    `(record, {column: values})` pair that varies a few numeric columns of one
+    record (returns an array).
+    """
+    predictor = _get_predictor(name)
+    if method == "one":
+        return predictor.predict_one(payload)
+    if method == "known":
+        return predictor.predict_known(*payload)
+    if method == "check":
+        return predictor.check_known(*payload)
+    if method == "many":
+        return predictor.predict_many(*payload)
+    return predictor.model.predict(payload).tolist()
+
+
+class ModelBusy(Exception):
+    """Raised when a model's concurrency slots and wait queue are both full."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Model '{name}' is at capacity, retry in {retry_after}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ModelLimiter:
+    """Per-model concurrency limit with a bounded queue of waiting requests."""
+
+    def __init__(self, name, executor, max_concurrency, max_queue):
+        self.name = name
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+class InferenceExecutor:
+    """Routes model calls to named executors, isolating cheap models from expensive ones.
+
+    Each model has its own concurrency limit and wait queue. When both are full
+    the call fails fast with `ModelBusy` (served as 429 + Retry-After) rather
+    than queueing without bound behind a slow model.
+    """
+
+    def __init__(self, retry_after=1):
+        self.retry_after = retry_after
+        self._executors = {}
+        self._models = {}
+
+    def add_executor(self, name, executor):
+        self._executors[name] = executor
+
+    def add_model(self, name, executor_name, max_concurrency, max_queue):
+        executor = self._executors[executor_name] if executor_name else None
+        self._models[name] = ModelLimiter(name, executor, max_concurrency, max_queue)
+
+    @asynccontextmanager
+    async def slot(self, name, bounded=True):
+        """Holds one of the model's concurrency slots; `bounded=False` waits instead of rejecting."""
+        limiter = self._models[name]
+        if bounded and limiter.running + limiter.waiting >= limiter.max_concurrency + limiter.max_queue:
+            limiter.rejected += 1
+            raise ModelBusy(name, self.retry_after)
+
+        limiter.waiting += 1
+        try:
+            with stage("queue", name):
+                await limiter._semaphore.acquire()
+        finally:
+            limiter.waiting -= 1
+        limiter.running += 1
+        try:
+            yield limiter
+        finally:
+            limiter.running -= 1
+            limiter.completed += 1
+            limiter._semaphore.release()
+
+    async def run(self, name, fn, *args, bounded=True):
+        """Runs `fn(*args)` on the model's executor once a slot is free."""
+        async with self.slot(name, bounded) as limiter:
+            loop = asyncio.get_running_loop()
+            with stage("predict", name):
+                return await loop.run_in_executor(limiter.executor, functools.partial(fn, *args))
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self._models.items()}
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def limits_from_env(name, max_concurrency, max_queue):
+    """Reads `<NAME>_MAX_CONCURRENCY` / `<NAME>_MAX_QUEUE` overrides for a model."""
+    prefix = name.upper()
+    return (
+        int(os.getenv(f'{prefix}_MAX_CONCURRENCY', str(max_concurrency))),
+        int(os.getenv(f'{prefix}_MAX_QUEUE', str(max_queue))),
+    )
@@ -0,0 +1,185 @@
+"""Per-stage request timing: Prometheus histograms, Server-Timing headers and sampled profiles.
+
+Handlers wrap their stages (decode, model_load, queue, predict, serialize, ...)
+in `stage(name, model)`. Each stage is observed in the
+`cropix_stage_duration_seconds{endpoint, model, stage}` histogram and, when
+SERVER_TIMING is on, reported back to the client in a `Server-Timing` header.
+`TimingMiddleware` also records whole-request latency and, for a sampled
+fraction of requests, writes a pyinstrument profile to PROFILE_DIR.
+"""
+import contextvars
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from fastapi.responses import PlainTextResponse, Response
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Stages run from a few hundred microseconds (encoding) to seconds (cold model loads)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+except ImportError:
+    Histogram = None
+
+if Histogram is not None:
+    STAGE_SECONDS = Histogram(
+        'cropix_stage_duration_seconds', 'Time spent in each stage of a request.',
+        ['endpoint', 'model', 'stage'], buckets=STAGE_BUCKETS,
+    )
+    REQUEST_SECONDS = Histogram(
+        'cropix_request_duration_seconds', 'Time from request start until the response headers are sent.',
+        ['endpoint', 'method', 'status'], buckets=STAGE_BUCKETS,
+    )
+    CACHE_LOOKUPS = Counter(
+        'cropix_cache_lookups_total', 'Cache lookups by outcome (memory_hit, disk_hit, coalesced, miss).',
+        ['cache', 'result'],
+    )
+else:
+    logger.warning("prometheus_client is not installed; /metrics is disabled")
+    STAGE_SECONDS = REQUEST_SECONDS = CACHE_LOOKUPS = None
+
+
+class RequestTimings:
+    def __init__(self, scope):
+        self.scope = scope
+        self.stages = []
+
+    @property
+    def endpoint(self):
+        # Route templates keep the label set bounded (no raw paths from 404 scans)
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(stage_name, seconds, model="", endpoint=None):
+    """Observes a stage duration; `endpoint` defaults to the current request's route."""
+    timings = _current.get()
+    if endpoint is None:
+        endpoint = timings.endpoint if timings is not None else "background"
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(endpoint, model, stage_name).observe(seconds)
+    if timings is not None:
+        timings.stages.append((stage_name, model, seconds))
+
+
+def record_cache_lookup(cache, result):
+    if CACHE_LOOKUPS is not None:
+        CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+@contextmanager
+def stage(stage_name, model="", endpoint=None):
+    """Times the enclosed block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, time.perf_counter() - start, model, endpoint)
+
+
+def server_timing_header(stages):
+    """Formats stages as a Server-Timing value; repeated stages (e.g. per-chunk predicts) are summed."""
+    totals = {}
+    for stage_name, model, seconds in stages:
+        totals[stage_name] = totals.get(stage_name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+# pyinstrument allows one running profiler per thread, so sampled requests are profiled one at a time
+_profiling = False
+
+
+def _start_profiler():
+    global _profiling
+    if _profiling:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("PROFILE_SAMPLE_RATE is set but pyinstrument is not installed; profiling disabled")
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    _profiling = True
+    return profiler
+
+
+def _save_profile(profiler, timings):
+    global _profiling
+    profiler.stop()
+    _profiling = False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = timings.endpoint.strip("/").replace("/", "_") or "root"
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.html")
+    with open(path, "w") as f:
+        f.write(profiler.output_html())
+
+
+class TimingMiddleware:
+    """ASGI middleware that owns the per-request timing context.
+
+    Written as plain ASGI (not BaseHTTPMiddleware) so streaming responses pass
+    through untouched; Server-Timing only covers stages finished before the
+    headers go out.
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING, profile_sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.server_timing = server_timing
+        self.profile_sample_rate = profile_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings(scope)
+        token = _current.set(timings)
+        profiler = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = _start_profiler()
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                if REQUEST_SECONDS is not None:
+                    REQUEST_SECONDS.labels(timings.endpoint, scope["method"], message["status"]).observe(
+                        time.perf_counter() - start
+                    )
+                if self.server_timing and timings.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings.stages).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                try:
+                    _save_profile(profiler, timings)
+                except Exception:
+                    logger.exception("Could not save the request profile")
+
+
+def metrics_response():
+    """Current metrics in the Prometheus text format (aggregated across workers in multiprocess mode)."""
+    if Histogram is None:
+        return PlainTextResponse("prometheus_client is not installed.\n", status_code=503)
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,33 +1,82 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 import joblib
+import math
 import numpy as np
 import pandas as pd
 import os
-import tensorflow as tf # type: ignore
-from tensorflow.keras.models import load_model # type: ignore
-from tensorflow.keras.preprocessing.image import ImageDataGenerator # type: ignore
-from sklearn.preprocessing import LabelEncoder
 from dotenv import load_dotenv
-import requests
-import json
-from sklearn.preprocessing import MinMaxScaler
-import os
-import numpy as np
-import tensorflow as tf
-from PIL import Image
-import io
+import httpx
 import base64
-import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+from batch_scoring import NDJSON_MEDIA_TYPE, read_batch, stream_predictions
+from bulk_ingest import UploadError, UploadStreamingResponse, iter_multipart_files, iter_zip_entries, screen_images
+from batching import MicroBatcher
+from disease_backends import DISEASE_BACKENDS, KerasBackend, TFLiteBackend
+from feature_encoding import FastPredictor
+from field_advisory import YieldSeason, build_records
+from forecasting import ForecastCache, MarketForecaster
+from image_preprocessing import DISEASE_IMAGE_SIZE, BatchBuffer, decode_image
+from instrumentation import TimingMiddleware, metrics_response, record_cache_lookup, stage
+from inference_executor import (
+    InferenceExecutor, ModelBusy, limits_from_env, load_tabular_predictors, predict_tabular, use_predictor_source,
+)
+from memory_report import mapped_file_memory, process_memory
+from model_registry import ModelRegistry
+from price_store import PriceStore
+from prediction_cache import DiskTier, PredictionCache, image_key
+from serialization import (
+    RESPONSE_FORMATS, ContentNegotiationMiddleware, CropixResponse, dumps_line, series_payload,
+)
+from soil_index import default_index_path, load_or_build_index
+from weather_client import DEFAULT_BASE_URL, WeatherClient, columnar_forecast
+from yield_optimizer import optimize
+
+# TensorFlow is only imported by the loaders of the models that need it, so a
+# worker that never loads the CNN or the LSTM never pays for the import.
 
-app = FastAPI()
+load_dotenv()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load models in the background so the server accepts connections right
+    # away; /ready/ reports when they are warm, and requests for a model that
+    # isn't loaded yet load it on demand.
+    app.state.preload = asyncio.create_task(run_in_threadpool(MODEL_REGISTRY.preload, PRELOAD_MODEL_NAMES))
+    yield
+    await DISEASE_BATCHER.stop()
+    await WEATHER_CLIENT.aclose()
+    INFERENCE.shutdown()
+    if DISEASE_CACHE is not None:
+        DISEASE_CACHE.close()
+
+# Every handler stage is timed into Prometheus histograms (GET /metrics) and,
+# with SERVER_TIMING=true, echoed in a Server-Timing response header.
+# Responses are rendered with orjson, or MessagePack for `Accept: application/msgpack`.
+app = FastAPI(lifespan=lifespan, default_response_class=CropixResponse)
+app.add_middleware(TimingMiddleware)
+app.add_middleware(ContentNegotiationMiddleware)
 
 origins = [
     "http://localhost:3000",  # Allow requests from your frontend
     "http://127.0.0.1:3000",
 ]
 
+@app.exception_handler(ModelBusy)
+async def model_busy_handler(request, exc):
+    return CropixResponse(
+        status_code=429,
+        content={"error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -35,18 +84,196 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-# Load models
-CROP_YIELD_MODEL = joblib.load('Trained_models/CROP_YIELD_MODEL.joblib')
-SOIL_CROP_RECOMMENDATION_MODEL = joblib.load('Trained_models/Soil_crop_recom.joblib')
-DISEASE_DETECTION_MODEL = load_model('Trained_models/CNN/Disease_Detection_model[CNN].h5')
-DISEASE_CLASSES = np.load('Trained_models/CNN/disease_classes.npy', allow_pickle=True)
-FERTILIZER_RECOMMENDATION_MODEL = joblib.load('Trained_models/fertilizer_recommendation_model.joblib')
-
-# Load LSTM Weather Forecast Model and preprocessing tools
-load_dotenv()
-WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
+# Model artifacts
+CROP_YIELD_MODEL_PATH = 'Trained_models/CROP_YIELD_MODEL.joblib'
+SOIL_CROP_MODEL_PATH = 'Trained_models/Soil_crop_recom.joblib'
+FERTILIZER_MODEL_PATH = 'Trained_models/fertilizer_recommendation_model.joblib'
+DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
+DISEASE_CLASSES_PATH = 'Trained_models/CNN/disease_classes.npy'
+DISEASE_TFLITE_PATH = os.getenv('DISEASE_TFLITE_PATH', 'Trained_models/CNN/Disease_Detection_model[CNN].tflite')
 MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
 MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv'
+# Binary price history, imported from the CSV once and appended to weekly (see price_store.py)
+MARKET_STORE_DIR = os.getenv('MARKET_STORE_DIR', 'Datasets/price_store')
+
+TABULAR_MODEL_PATHS = {
+    "crop_yield": CROP_YIELD_MODEL_PATH,
+    "soil_crop": SOIL_CROP_MODEL_PATH,
+    "fertilizer": FERTILIZER_MODEL_PATH,
+}
+
+
+# Numpy arrays inside the joblib files are memory-mapped read-only by default, so
+# forked workers (see serve.py) share those pages instead of each holding a copy.
+# Set JOBLIB_MMAP_MODE=none to load everything onto the heap.
+JOBLIB_MMAP_MODE = os.getenv('JOBLIB_MMAP_MODE', 'r')
+JOBLIB_MMAP_MODE = None if JOBLIB_MMAP_MODE == 'none' else JOBLIB_MMAP_MODE
+
+
+def load_tabular_model(name):
+    # Single-record predictions skip DataFrame construction when the fast path matches the pipeline
+    return FastPredictor(joblib.load(TABULAR_MODEL_PATHS[name], mmap_mode=JOBLIB_MMAP_MODE), name)
+
+
+# DISEASE_BACKEND=tflite serves the CNN from a converted/quantized export
+# (python disease_backends.py export) instead of the Keras .h5 model.
+DISEASE_BACKEND = os.getenv('DISEASE_BACKEND', 'keras')
+if DISEASE_BACKEND not in DISEASE_BACKENDS:
+    raise ValueError(f"DISEASE_BACKEND must be one of {', '.join(DISEASE_BACKENDS)}")
+DISEASE_TFLITE_THREADS = int(os.getenv('DISEASE_TFLITE_THREADS', '0')) or None
+DISEASE_BACKEND_PATH = DISEASE_TFLITE_PATH if DISEASE_BACKEND == 'tflite' else DISEASE_MODEL_PATH
+
+
+def load_disease_model():
+    if DISEASE_BACKEND == 'tflite':
+        backend = TFLiteBackend.load(DISEASE_TFLITE_PATH, DISEASE_TFLITE_THREADS)
+    else:
+        backend = KerasBackend.load(DISEASE_MODEL_PATH)
+    classes = np.load(DISEASE_CLASSES_PATH, allow_pickle=True)
+    return backend, classes
+
+
+def warm_up_disease_model(disease_model):
+    backend, _ = disease_model
+    width, height = DISEASE_IMAGE_SIZE
+    backend.predict(np.zeros((1, height, width, 3), dtype=np.float32))
+
+
+# Every model is loaded once, warmed up, and hot-reloaded when its files change.
+# Loading is lazy: PRELOAD_MODELS ("all", "none" or a comma-separated list of
+# names) picks what is loaded concurrently at startup; the rest load on first use.
+MODEL_REGISTRY = ModelRegistry()
+for _name, _path in TABULAR_MODEL_PATHS.items():
+    MODEL_REGISTRY.register(_name, [_path], lambda name=_name: load_tabular_model(name))
+MODEL_REGISTRY.register(
+    "disease_detection",
+    [DISEASE_BACKEND_PATH, DISEASE_CLASSES_PATH],
+    load_disease_model,
+    warmup=warm_up_disease_model,
+)
+# The price store tracks its own appends (and new CSV rows), so the forecaster
+# only reloads when the LSTM itself changes.
+MODEL_REGISTRY.register("market_prices", [], lambda: PriceStore.open(MARKET_STORE_DIR, MARKET_DATA_PATH))
+MODEL_REGISTRY.register(
+    "market_forecaster",
+    [MARKET_MODEL_PATH],
+    lambda: MarketForecaster.load(MARKET_MODEL_PATH, MODEL_REGISTRY.get("market_prices")),
+    warmup=lambda forecaster: forecaster.warm_up(),
+)
+# Top-k soil recommendations come from a KD-tree index derived from the KNN
+# model and persisted next to it; it is rebuilt when the model file changes.
+MODEL_REGISTRY.register("soil_crop_index", [SOIL_CROP_MODEL_PATH], lambda: load_or_build_index(SOIL_CROP_MODEL_PATH),
+                        memory_paths=[default_index_path(SOIL_CROP_MODEL_PATH)])
+use_predictor_source(MODEL_REGISTRY.get)
+
+# Models backed by the TensorFlow runtime, which must not be loaded before forking workers
+TENSORFLOW_MODEL_NAMES = {"disease_detection", "market_forecaster"}
+
+# Model calls run off the event loop, each model with its own concurrency limit and
+# wait queue; when both are full the request gets a 429 with Retry-After.
+# TABULAR_EXECUTOR=process moves the sklearn/XGBoost models to worker processes.
+TABULAR_EXECUTOR = os.getenv('TABULAR_EXECUTOR', 'thread')
+TABULAR_WORKERS = int(os.getenv('TABULAR_WORKERS', '4'))
+INFERENCE = InferenceExecutor(retry_after=int(os.getenv('INFERENCE_RETRY_AFTER_SECONDS', '1')))
+INFERENCE.add_executor("tensorflow", ThreadPoolExecutor(
+    max_workers=int(os.getenv('TF_INFERENCE_THREADS', '2')), thread_name_prefix="tf-inference"))
+if TABULAR_EXECUTOR == 'process':
+    INFERENCE.add_executor("tabular", ProcessPoolExecutor(
+        max_workers=TABULAR_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=load_tabular_predictors,
+        initargs=(TABULAR_MODEL_PATHS, JOBLIB_MMAP_MODE),
+    ))
+else:
+    INFERENCE.add_executor("tabular", ThreadPoolExecutor(
+        max_workers=TABULAR_WORKERS, thread_name_prefix="tabular-inference"))
+INFERENCE.add_model("crop_yield", "tabular", *limits_from_env("crop_yield", 4, 64))
+INFERENCE.add_model("soil_crop", "tabular", *limits_from_env("soil_crop", 4, 64))
+INFERENCE.add_model("fertilizer", "tabular", *limits_from_env("fertilizer", 4, 64))
+INFERENCE.add_model("market_forecast", "tensorflow", *limits_from_env("market_forecast", 2, 16))
+# Bulk uploads bring their own full batches; one CNN call at a time keeps them from crowding out the LSTM
+INFERENCE.add_model("disease_bulk", "tensorflow", *limits_from_env("disease_bulk", 1, 16))
+INFERENCE.add_model("soil_crop_index", None, *limits_from_env("soil_crop_index", 4, 64))
+# The disease batcher owns its predict thread; this only bounds how many requests queue for it
+INFERENCE.add_model("disease_detection", None, *limits_from_env("disease_detection", 64, 256))
+
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'all').strip()
+if PRELOAD_MODELS == 'all':
+    PRELOAD_MODEL_NAMES = MODEL_REGISTRY.names
+elif PRELOAD_MODELS == 'none':
+    PRELOAD_MODEL_NAMES = []
+else:
+    PRELOAD_MODEL_NAMES = [name.strip() for name in PRELOAD_MODELS.split(',') if name.strip()]
+    _unknown = [name for name in PRELOAD_MODEL_NAMES if name not in MODEL_REGISTRY.names]
+    if _unknown:
+        raise ValueError(f"Unknown model(s) in PRELOAD_MODELS: {', '.join(_unknown)}. "
+                         f"Use all, none or a comma-separated list of: {', '.join(MODEL_REGISTRY.names)}")
+if TABULAR_EXECUTOR == 'process':
+    # Worker processes hold their own copies; the parent doesn't need them
+    PRELOAD_MODEL_NAMES = [name for name in PRELOAD_MODEL_NAMES if name not in TABULAR_MODEL_PATHS]
+
+# /batch/ endpoints: upload size limit and rows per vectorized predict call
+BATCH_MAX_ROWS = int(os.getenv('BATCH_MAX_ROWS', '100000'))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(64 * 1024 * 1024)))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '10000'))
+
+# Weather API client
+WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
+WEATHER_CLIENT = WeatherClient(
+    WEATHER_API_KEY,
+    base_url=os.getenv('WEATHER_API_BASE_URL', DEFAULT_BASE_URL),
+    cache_ttl=float(os.getenv('WEATHER_CACHE_TTL_SECONDS', '600')),
+    timeout=float(os.getenv('WEATHER_API_TIMEOUT_SECONDS', '5')),
+    retries=int(os.getenv('WEATHER_API_RETRIES', '2')),
+)
+
+# All-crops market forecast, computed once per dataset/model version and sliced per request.
+# MAX_FORECAST_WEEKS bounds both the requests and how far the cached forecast grows.
+MAX_FORECAST_WEEKS = int(os.getenv('MAX_FORECAST_WEEKS', '104'))
+FORECAST_CACHE = ForecastCache(
+    min_horizon=min(int(os.getenv('FORECAST_CACHE_MIN_WEEKS', '52')), MAX_FORECAST_WEEKS),
+)
+
+# Concurrent /detect_disease/ requests are coalesced into one CNN call per window
+DISEASE_BATCH_MAX_SIZE = int(os.getenv('DISEASE_BATCH_MAX_SIZE', '32'))
+DISEASE_BATCH_MAX_WAIT_MS = float(os.getenv('DISEASE_BATCH_MAX_WAIT_MS', '10'))
+
+
+def _top_classes(predictions, classes):
+    return [(classes[index], float(row[index])) for index, row in zip(np.argmax(predictions, axis=1), predictions)]
+
+
+def predict_disease_batch(batch):
+    # Runs on the batcher's thread, so a lazy first load never blocks the event loop
+    backend, classes = MODEL_REGISTRY.get("disease_detection")
+    with stage("batch_predict", "disease_detection", endpoint="disease_batcher"):
+        predictions = backend.predict(batch)
+    return _top_classes(predictions, classes)
+
+DISEASE_BATCHER = MicroBatcher(
+    predict_disease_batch,
+    max_batch_size=DISEASE_BATCH_MAX_SIZE,
+    max_wait_ms=DISEASE_BATCH_MAX_WAIT_MS,
+    name="disease-batcher",
+    collate_fn=BatchBuffer(DISEASE_BATCH_MAX_SIZE),
+)
+
+# Resubmitted photos (retries, several apps syncing the same picture) are answered
+# from a cache keyed on the decoded pixels and model version. DISEASE_CACHE_SIZE=0
+# disables it; DISEASE_CACHE_PATH adds an SQLite tier that survives restarts.
+DISEASE_CACHE_SIZE = int(os.getenv('DISEASE_CACHE_SIZE', '10000'))
+DISEASE_CACHE_PATH = os.getenv('DISEASE_CACHE_PATH')
+DISEASE_CACHE = PredictionCache(
+    DISEASE_CACHE_SIZE,
+    disk=DiskTier(DISEASE_CACHE_PATH, int(os.getenv('DISEASE_CACHE_DISK_MAX_ENTRIES', '100000')))
+    if DISEASE_CACHE_PATH else None,
+    on_lookup=lambda result: record_cache_lookup("disease_detection", result),
+) if DISEASE_CACHE_SIZE > 0 else None
+
+
+def disease_cache_key(img_array):
+    _, version = MODEL_REGISTRY.get_versioned("disease_detection")
+    return image_key(img_array, f"{DISEASE_BACKEND}:{version}")
 
 
 @app.get("/")
@@ -63,19 +290,102 @@ class CropYieldInput(BaseModel):
     ph: float
     rainfall: float
     Crop: str
-    Season: str
+    Season: YieldSeason
     Area: float
     Fertilizer: float
     Crop_Year: int
     Pesticide: float
     Annual_Rainfall: float
 
+async def ensure_model_loaded(name):
+    # A cold (lazy) load shows up as its own stage instead of inflating "predict"
+    if TABULAR_EXECUTOR == 'process' and name in TABULAR_MODEL_PATHS:
+        return  # loaded by the worker processes, not here
+    if not MODEL_REGISTRY.is_loaded(name):
+        with stage("model_load", name):
+            await run_in_threadpool(MODEL_REGISTRY.get, name)
+
+async def _predict_tabular_one(name, record, known_columns=()):
+    # `known_columns` must hold categories the model was fitted on (ValueError otherwise)
+    await ensure_model_loaded(name)
+    if known_columns:
+        return await INFERENCE.run(name, predict_tabular, name, "known", (record, known_columns))
+    return await INFERENCE.run(name, predict_tabular, name, "one", record)
+
+async def _predict_tabular_chunk(name, chunk):
+    # Batch chunks wait for a slot rather than being rejected mid-stream
+    await ensure_model_loaded(name)
+    return await INFERENCE.run(name, predict_tabular, name, "frame", chunk, bounded=False)
+
 @app.post("/predict_crop_yield/")
 async def predict_crop_yield(input: CropYieldInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction = CROP_YIELD_MODEL.predict(df_input)[0]
+    prediction = await _predict_tabular_one("crop_yield", input.dict())
     return {"predicted_yield": prediction.item()}
 
+@app.post("/predict_crop_yield/batch/")
+async def predict_crop_yield_batch(request: Request):
+    df_input = await read_batch(request, CropYieldInput, BATCH_MAX_ROWS, BATCH_MAX_BYTES)
+
+    async def predict_chunk(chunk):
+        values = await _predict_tabular_chunk("crop_yield", chunk)
+        return [{"predicted_yield": value} for value in values]
+
+    return stream_predictions(df_input, predict_chunk, BATCH_CHUNK_SIZE)
+
+# Grid search limits for /predict_crop_yield/optimize/
+OPTIMIZER_MAX_POINTS = int(os.getenv('OPTIMIZER_MAX_POINTS', '100000'))
+OPTIMIZER_MAX_STEPS = int(os.getenv('OPTIMIZER_MAX_STEPS', '1000'))
+OPTIMIZER_MAX_TIME_BUDGET_MS = float(os.getenv('OPTIMIZER_MAX_TIME_BUDGET_MS', '10000'))
+OPTIMIZER_CHUNK_SIZE = int(os.getenv('OPTIMIZER_CHUNK_SIZE', '10000'))
+
+class SearchRange(BaseModel):
+    min: float
+    max: float
+    steps: int = Field(10, ge=1, le=OPTIMIZER_MAX_STEPS)
+
+class YieldOptimizationInput(BaseModel):
+    Crop: str
+    Season: YieldSeason
+    Crop_Year: int
+    Annual_Rainfall: float
+    Fertilizer: SearchRange
+    Pesticide: SearchRange
+    Area: SearchRange
+    refine_rounds: int = 2
+    time_budget_ms: float = 2000
+
+@app.post("/predict_crop_yield/optimize/")
+async def optimize_crop_yield(input: YieldOptimizationInput):
+    # Each chunk of grid points is one vectorized predict call on the yield model
+    ranges = {name: getattr(input, name) for name in ("Fertilizer", "Pesticide", "Area")}
+    if any(r.max < r.min for r in ranges.values()):
+        return {"error": "Each range needs max >= min."}
+    # Python ints: a NumPy product can overflow to a small number and pass the limit
+    points = math.prod(r.steps if r.max > r.min else 1 for r in ranges.values())
+    if points > OPTIMIZER_MAX_POINTS:
+        return {"error": f"The grid has {points} points; the limit is {OPTIMIZER_MAX_POINTS}."}
+    record = {"Crop": input.Crop, "Season": input.Season, "Crop_Year": input.Crop_Year,
+              "Annual_Rainfall": input.Annual_Rainfall}
+    await ensure_model_loaded("crop_yield")
+    # An unknown crop would be one-hot encoded as all zeros and still get a whole surface
+    try:
+        await INFERENCE.run("crop_yield", predict_tabular, "crop_yield", "check", (record, ("Crop",)))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    async def predict(overrides):
+        return await INFERENCE.run("crop_yield", predict_tabular, "crop_yield", "many", (record, overrides),
+                                   bounded=False)
+
+    # The surface can run to 100k values, so it skips jsonable_encoder
+    return CropixResponse(await optimize(
+        predict,
+        {name: (r.min, r.max, r.steps) for name, r in ranges.items()},
+        min(input.time_budget_ms, OPTIMIZER_MAX_TIME_BUDGET_MS) / 1000,
+        chunk_size=OPTIMIZER_CHUNK_SIZE,
+        refine_rounds=max(input.refine_rounds, 0),
+    ))
+
 class SoilCropRecommendationInput(BaseModel):
     N: float
     P: float
@@ -87,104 +397,260 @@ class SoilCropRecommendationInput(BaseModel):
 
 @app.post("/recommend_soil_crop/")
 async def recommend_soil_crop(input: SoilCropRecommendationInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction_label = SOIL_CROP_RECOMMENDATION_MODEL.predict(df_input)[0]
+    prediction_label = await _predict_tabular_one("soil_crop", input.dict())
     return {"recommended_crop": prediction_label}
 
+@app.post("/recommend_soil_crop/batch/")
+async def recommend_soil_crop_batch(request: Request):
+    df_input = await read_batch(request, SoilCropRecommendationInput, BATCH_MAX_ROWS, BATCH_MAX_BYTES)
+
+    async def predict_chunk(chunk):
+        labels = await _predict_tabular_chunk("soil_crop", chunk)
+        return [{"recommended_crop": label} for label in labels]
+
+    return stream_predictions(df_input, predict_chunk, BATCH_CHUNK_SIZE)
+
+class SoilCropTopKInput(SoilCropRecommendationInput):
+    k: int = 3
+
+def recommend_soil_crops(samples, k):
+    # Runs off the event loop; `samples` is a list of records or a DataFrame
+    index = MODEL_REGISTRY.get("soil_crop_index")
+    columns = index.feature_names or list(SoilCropRecommendationInput.__annotations__)
+    if isinstance(samples, pd.DataFrame):
+        points = samples[columns].to_numpy(dtype=np.float64)
+    else:
+        points = [[record[column] for column in columns] for record in samples]
+    return index.recommend(points, k)
+
+@app.post("/recommend_soil_crop/top_k/")
+async def recommend_soil_crop_top_k(input: SoilCropTopKInput):
+    if input.k < 1:
+        return {"error": "k must be at least 1."}
+    await ensure_model_loaded("soil_crop_index")
+    recommendations = await INFERENCE.run("soil_crop_index", recommend_soil_crops, [input.dict()], input.k)
+    return {"recommendations": recommendations[0]}
+
+@app.post("/recommend_soil_crop/top_k/batch/")
+async def recommend_soil_crop_top_k_batch(request: Request, k: int = 3):
+    if k < 1:
+        return {"error": "k must be at least 1."}
+    df_input = await read_batch(request, SoilCropRecommendationInput, BATCH_MAX_ROWS, BATCH_MAX_BYTES)
+    await ensure_model_loaded("soil_crop_index")
+
+    async def predict_chunk(chunk):
+        # One vectorized index query per chunk
+        recommendations = await INFERENCE.run(
+            "soil_crop_index", recommend_soil_crops, chunk, k, bounded=False,
+        )
+        return [{"recommendations": row} for row in recommendations]
+
+    return stream_predictions(df_input, predict_chunk, BATCH_CHUNK_SIZE)
+
 class DiseaseDetectionInput(BaseModel):
     image_base64: str
 
-@app.post("/detect_disease/")
-async def detect_disease(input: DiseaseDetectionInput):
-    from PIL import Image
-    import io
-    import base64
-    import uuid
-
+async def _detect_disease_from_bytes(image_data):
+    # Decode and resize off the event loop; the batcher normalizes the uint8
+    # image straight into the shared float32 batch buffer.
+    with stage("decode", "disease_detection"):
+        img_array = await run_in_threadpool(decode_image, image_data)
+    await ensure_model_loaded("disease_detection")
+
+    async def predict():
+        async with INFERENCE.slot("disease_detection"):
+            # Includes the wait for the batch window to close
+            with stage("predict", "disease_detection"):
+                return await DISEASE_BATCHER.submit(img_array)
+
+    if DISEASE_CACHE is None:
+        predicted_class, confidence = await predict()
+    else:
+        with stage("cache_key", "disease_detection"):
+            key = await run_in_threadpool(disease_cache_key, img_array)
+        predicted_class, confidence = await DISEASE_CACHE.get_or_predict(key, predict, run_in_threadpool)
+    return {"predicted_disease": predicted_class, "confidence": confidence}
+
+async def _detect_disease(read_stage, read_image):
+    # Bad images are answered with {"error": ...}, but a full inference queue
+    # must reach the ModelBusy handler (429 + Retry-After) to act as backpressure
     try:
-        # Decode the base64 string
-        image_data = base64.b64decode(input.image_base64)
-        image = Image.open(io.BytesIO(image_data))
-
-        # Save the image temporarily
-        temp_filename = f"temp_image_{uuid.uuid4()}.png"
-        temp_filepath = os.path.join("temp_images", temp_filename)
-        os.makedirs("temp_images", exist_ok=True)
-        image.save(temp_filepath)
-
-        img = tf.keras.preprocessing.image.load_img(temp_filepath, target_size=(256, 256)) # type: ignore
-        img_array = tf.keras.preprocessing.image.img_to_array(img) # type: ignore
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array /= 255.0
-
-        predictions = DISEASE_DETECTION_MODEL.predict(img_array)
-        predicted_class_index = np.argmax(predictions)
-        predicted_class = DISEASE_CLASSES[predicted_class_index]
-        confidence = float(np.max(predictions))
-
-        # Clean up the temporary file
-        os.remove(temp_filepath)
-        return {"predicted_disease": predicted_class, "confidence": confidence}
+        with stage(read_stage, "disease_detection"):
+            image_data = await read_image()
+        return await _detect_disease_from_bytes(image_data)
+    except ModelBusy:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/detect_disease/")
+async def detect_disease(input: DiseaseDetectionInput):
+    async def read_image():
+        return base64.b64decode(input.image_base64)
+
+    return await _detect_disease("decode_base64", read_image)
+
+@app.post("/detect_disease/upload/")
+async def detect_disease_upload(file: UploadFile = File(...)):
+    # Raw multipart upload: avoids the ~33% size overhead of base64 JSON bodies
+    return await _detect_disease("read_upload", file.read)
+
+# Bulk screening: a ZIP or multipart upload of many images, answered as NDJSON
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', str(DISEASE_BATCH_MAX_SIZE)))
+BULK_MAX_IMAGES = int(os.getenv('BULK_MAX_IMAGES', '5000'))
+BULK_MAX_IMAGE_BYTES = int(os.getenv('BULK_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+
+
+def predict_disease_images(images):
+    backend, classes = MODEL_REGISTRY.get("disease_detection")
+    batch = np.empty((len(images), *images[0].shape), dtype=np.float32)
+    for slot, image in zip(batch, images):
+        np.divide(image, 255.0, out=slot, dtype=np.float32)
+    return _top_classes(backend.predict(batch), classes)
+
+@app.post("/detect_disease/bulk/")
+async def detect_disease_bulk(request: Request):
+    # Images are decoded and classified while the upload is still arriving, and
+    # each result line is sent as soon as its batch is done.
+    content_type = request.headers.get("content-type", "")
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in ("application/zip", "application/x-zip-compressed"):
+        entries = iter_zip_entries(request.stream(), BULK_MAX_IMAGE_BYTES)
+    elif media_type == "multipart/form-data":
+        entries = iter_multipart_files(request.stream(), content_type, BULK_MAX_IMAGE_BYTES)
+    else:
+        return CropixResponse(status_code=415, content={"error": "Upload a ZIP archive or multipart/form-data."})
+    await ensure_model_loaded("disease_detection")
+
+    async def decode(image_data):
+        return await run_in_threadpool(decode_image, image_data)
+
+    async def predict(images):
+        return await INFERENCE.run("disease_bulk", predict_disease_images, images, bounded=False)
+
+    async def generate():
+        try:
+            async for result in screen_images(entries, decode, predict, BULK_BATCH_SIZE, BULK_MAX_IMAGES):
+                yield dumps_line(result)
+        except UploadError as e:
+            yield dumps_line({"error": str(e)})
+
+    return UploadStreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/detect_disease/batching_stats/")
+async def disease_batching_stats():
+    return {
+        "backend": DISEASE_BACKEND,
+        "max_batch_size": DISEASE_BATCHER.max_batch_size,
+        "max_wait_ms": DISEASE_BATCH_MAX_WAIT_MS,
+        **DISEASE_BATCHER.stats.snapshot(),
+    }
+
+@app.get("/detect_disease/cache_stats/")
+def disease_cache_stats():
+    # Sync so counting the disk tier's rows stays off the event loop
+    if DISEASE_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, "disk_path": DISEASE_CACHE_PATH, **DISEASE_CACHE.stats()}
+
+@app.get("/models/")
+async def model_status():
+    return MODEL_REGISTRY.status()
+
+@app.get("/memory/")
+def memory_report(models: bool = True):
+    # Shared vs private pages show how much of the RSS forked workers have in common.
+    # Scanning the memory maps is slow, so this runs in the threadpool and
+    # `?models=false` skips it (e.g. when polling RSS during a benchmark).
+    report = {"process": process_memory()}
+    if models:
+        statuses = MODEL_REGISTRY.status()
+        # Each file is counted once, for its owning model
+        owned = MODEL_REGISTRY.memory_paths()
+        mapped = mapped_file_memory([path for paths in owned.values() for path in paths])
+        report["models"] = {
+            name: {
+                "loaded": status["loaded"],
+                # Whole-process RSS growth; approximate if other models loaded at the same time
+                "load_rss_delta": status["load_rss_delta"],
+                "load_rss_approximate": status["load_rss_approximate"],
+                "mapped_file_rss": sum(mapped[path] for path in owned[name]),
+            }
+            for name, status in statuses.items()
+        }
+    return report
+
+@app.get("/ready/")
+async def readiness():
+    # Ready once every model selected by PRELOAD_MODELS is warm
+    ready = all(MODEL_REGISTRY.is_loaded(name) for name in PRELOAD_MODEL_NAMES)
+    return CropixResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "models": MODEL_REGISTRY.status()},
+    )
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape target: per-endpoint/model/stage latency histograms
+    return metrics_response()
+
+@app.get("/inference/stats/")
+async def inference_stats():
+    return INFERENCE.stats()
+
+@app.get("/forecast_market_prices/cache_stats/")
+async def forecast_cache_stats():
+    return FORECAST_CACHE.stats()
+
 class LSTMWeatherForecastInput(BaseModel):
     city: str
     days: int
 
-@app.post("/weather_forecast_lstm/")
-async def weather_forecast_lstm(input: LSTMWeatherForecastInput):
+# ?format=records (default) or ?format=compact on the forecast endpoints
+RESPONSE_FORMAT = Query("records", alias="format")
+
+def _check_format(response_format):
+    if response_format not in RESPONSE_FORMATS:
+        return {"error": f"format must be one of {', '.join(RESPONSE_FORMATS)}."}
+    return None
+
+async def _weather_forecast(city, days, response_format="records"):
     if not WEATHER_API_KEY:
         return {"error": "Weather API key not found."}
 
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={WEATHER_API_KEY}&q={input.city}&days={input.days}"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()['forecast']['forecastday']
-
-    forecast_summary = []
-    for day_data in data:
-        date = day_data['date']
-        day_info = day_data['day']
-        forecast_summary.append({
-            "date": date,
-            "min_temp_c": day_info['mintemp_c'],
-            "max_temp_c": day_info['maxtemp_c'],
-            "avg_temp_c": day_info['avgtemp_c'],
-            "avg_humidity": day_info['avghumidity'],
-            "chance_of_rain": day_info['daily_chance_of_rain'],
-            "condition": day_info['condition']['text']
-        })
+    try:
+        with stage("upstream", "weatherapi"):
+            forecast_summary = await WEATHER_CLIENT.forecast(city, days)
+    except httpx.HTTPStatusError as e:
+        return {"error": f"Weather API responded with status {e.response.status_code}."}
+    except httpx.RequestError as e:
+        return {"error": f"Could not connect to the weather service: {e}"}
+    if response_format == "compact":
+        return {"forecast": columnar_forecast(forecast_summary)}
     return {"forecast": forecast_summary}
 
+@app.post("/weather_forecast_lstm/")
+async def weather_forecast_lstm(input: LSTMWeatherForecastInput, response_format: str = RESPONSE_FORMAT):
+    error = _check_format(response_format)
+    if error:
+        return error
+    return CropixResponse(await _weather_forecast(input.city, input.days, response_format))
+
 class WeatherForecastInput(BaseModel):
     city: str
     days: int
 
 @app.post("/weather_forecast/")
-async def weather_forecast(input: WeatherForecastInput):
-    if not WEATHER_API_KEY:
-        return {"error": "Weather API key not found."}
+async def weather_forecast(input: WeatherForecastInput, response_format: str = RESPONSE_FORMAT):
+    # format=compact returns one array per field instead of one object per day
+    error = _check_format(response_format)
+    if error:
+        return error
+    return CropixResponse(await _weather_forecast(input.city, input.days, response_format))
 
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={WEATHER_API_KEY}&q={input.city}&days={input.days}"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()['forecast']['forecastday']
-
-    forecast_summary = []
-    for day_data in data:
-        date = day_data['date']
-        day_info = day_data['day']
-        forecast_summary.append({
-            "date": date,
-            "min_temp_c": day_info['mintemp_c'],
-            "max_temp_c": day_info['maxtemp_c'],
-            "avg_temp_c": day_info['avgtemp_c'],
-            "avg_humidity": day_info['avghumidity'],
-            "chance_of_rain": day_info['daily_chance_of_rain'],
-            "condition": day_info['condition']['text']
-        })
-    return {"forecast": forecast_summary}
+@app.get("/weather_forecast/cache_stats/")
+async def weather_cache_stats():
+    return WEATHER_CLIENT.stats()
 
 class FertilizerRecommendationInput(BaseModel):
     Crop: str
@@ -194,45 +660,189 @@ class FertilizerRecommendationInput(BaseModel):
 
 @app.post("/recommend_fertilizer/")
 async def recommend_fertilizer(input: FertilizerRecommendationInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction = FERTILIZER_RECOMMENDATION_MODEL.predict(df_input)[0]
+    prediction = await _predict_tabular_one("fertilizer", input.dict())
     return {"recommended_N": prediction[0].item(), "recommended_P": prediction[1].item(), "recommended_K": prediction[2].item()}
 
-class MarketPriceForecastInput(BaseModel):
-    crop_name: str
-    weeks_to_forecast: int
-
-@app.post("/forecast_market_prices/")
-async def forecast_market_prices(input: MarketPriceForecastInput):
-    model = load_model(MARKET_MODEL_PATH)
-    df_historical = pd.read_csv(MARKET_DATA_PATH, index_col='Date', parse_dates=True)
-
-    if input.crop_name not in df_historical.columns:
-        return {"error": f"Crop '{input.crop_name}' not found in historical data."}
+@app.post("/recommend_fertilizer/batch/")
+async def recommend_fertilizer_batch(request: Request):
+    df_input = await read_batch(request, FertilizerRecommendationInput, BATCH_MAX_ROWS, BATCH_MAX_BYTES)
 
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(df_historical)
+    async def predict_chunk(chunk):
+        values = await _predict_tabular_chunk("fertilizer", chunk)
+        return [{"recommended_N": n, "recommended_P": p, "recommended_K": k} for n, p, k in values]
 
-    n_steps = 8  # This must match the model's training configuration
-    n_features = df_historical.shape[1]
+    return stream_predictions(df_input, predict_chunk, BATCH_CHUNK_SIZE)
 
-    last_known_data = scaled_data[-n_steps:]
-    current_batch = last_known_data.reshape((1, n_steps, n_features))
-    forecast = []
+class FieldAdvisoryInput(SoilCropRecommendationInput):
+    # Yield model inputs other than the crop, which comes from the soil recommendation
+    Season: YieldSeason
+    Area: float
+    Fertilizer: float
+    Crop_Year: int
+    Pesticide: float
+    Annual_Rainfall: float
+    city: str | None = None
+    days: int = 3
 
-    for _ in range(input.weeks_to_forecast):
-        current_pred = model.predict(current_batch, verbose=0)[0]
-        forecast.append(current_pred)
-        current_batch = np.append(current_batch[:, 1:, :], [[current_pred]], axis=1)
+async def _advisory_branch(name, predict):
+    # One failing model is reported in its own section instead of failing the advisory
+    try:
+        with stage("advisory_" + name, name):
+            return await predict()
+    except ModelBusy:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
 
-    forecast_prices = scaler.inverse_transform(forecast)
+@app.post("/field_advisory/")
+async def field_advisory(input: FieldAdvisoryInput):
+    # soil -> (fertilizer, yield), with the weather lookup running alongside, so
+    # the latency is that of the slowest branch rather than the sum of the calls
+    soil_record, downstream_records = build_records(input.dict())
+    weather = asyncio.ensure_future(
+        _weather_forecast(input.city, input.days) if input.city else asyncio.sleep(0, result=None)
+    )
+    try:
+        with stage("advisory_soil_crop", "soil_crop"):
+            recommended_crop = await _predict_tabular_one("soil_crop", soil_record)
+        fertilizer_record, yield_record = downstream_records(recommended_crop)
+
+        async def fertilizer():
+            # The mapped crop may be one the model never saw; that is an error, not a prediction
+            prediction = await _predict_tabular_one("fertilizer", fertilizer_record, ("Crop",))
+            return {"recommended_N": prediction[0].item(), "recommended_P": prediction[1].item(),
+                    "recommended_K": prediction[2].item()}
+
+        async def crop_yield():
+            prediction = await _predict_tabular_one("crop_yield", yield_record, ("Crop",))
+            return {"predicted_yield": prediction.item()}
+
+        fertilizer_result, yield_result = await asyncio.gather(
+            _advisory_branch("fertilizer", fertilizer), _advisory_branch("crop_yield", crop_yield),
+        )
+        weather_result = await weather
+    finally:
+        weather.cancel()
+    return {
+        "recommended_crop": recommended_crop,
+        "crop": {"fertilizer": fertilizer_record["Crop"], "yield": yield_record["Crop"]},
+        "fertilizer": fertilizer_result,
+        "yield": yield_result,
+        "weather": weather_result,
+    }
 
-    last_historical_date = df_historical.index[-1]
-    future_dates = pd.to_datetime([last_historical_date + pd.Timedelta(weeks=i) for i in range(1, input.weeks_to_forecast + 1)])
-    df_forecast = pd.DataFrame(forecast_prices, index=future_dates, columns=df_historical.columns)
+class MarketPriceForecastInput(BaseModel):
+    crop_name: str
+    weeks_to_forecast: int = Field(le=MAX_FORECAST_WEEKS)
 
-    return {"forecast": df_forecast[[input.crop_name]].round(2).to_dict()}
+@app.post("/forecast_market_prices/")
+async def forecast_market_prices(input: MarketPriceForecastInput, response_format: str = RESPONSE_FORMAT):
+    # format=compact: {"start", "step_days", "values": {crop: [...]}} instead of one key per week
+    if input.weeks_to_forecast < 1:
+        return {"error": "weeks_to_forecast must be at least 1."}
+    error = _check_format(response_format)
+    if error:
+        return error
+
+    def forecast():
+        # Runs on the TensorFlow executor: may reload the model and roll out the LSTM
+        forecaster, version = MODEL_REGISTRY.get_versioned("market_forecaster")
+        if input.crop_name not in forecaster.crops:
+            return None
+        return FORECAST_CACHE.get(forecaster, f"{version}:{forecaster.revision}", input.weeks_to_forecast)
+
+    await ensure_model_loaded("market_forecaster")
+    df_forecast = await INFERENCE.run("market_forecast", forecast)
+    if df_forecast is None:
+        return {"error": f"Crop '{input.crop_name}' not found in historical data."}
+    with stage("postprocess", "market_forecast"):
+        forecast = series_payload(response_format, df_forecast.index, {input.crop_name: df_forecast[input.crop_name]})
+    return CropixResponse({"forecast": forecast})
+
+class MarketScenario(BaseModel):
+    name: str
+    # Fractional change to the latest week's price per crop, e.g. {"Wheat": -0.1}
+    shocks: dict[str, float] = {}
+
+class MarketScenarioForecastInput(BaseModel):
+    crops: list[str] = []  # empty: every crop
+    # Every scenario is rolled out over the full horizon
+    weeks_to_forecast: int = Field(le=MAX_FORECAST_WEEKS)
+    scenarios: list[MarketScenario] = []
+
+MARKET_MAX_SCENARIOS = int(os.getenv('MARKET_MAX_SCENARIOS', '64'))
+
+@app.post("/forecast_market_prices/scenarios/")
+async def forecast_market_scenarios(input: MarketScenarioForecastInput, response_format: str = RESPONSE_FORMAT):
+    # Every crop and scenario (plus the unshocked baseline) comes from one batched rollout
+    if input.weeks_to_forecast < 1:
+        return {"error": "weeks_to_forecast must be at least 1."}
+    error = _check_format(response_format)
+    if error:
+        return error
+    if len(input.scenarios) > MARKET_MAX_SCENARIOS:
+        return {"error": f"At most {MARKET_MAX_SCENARIOS} scenarios can be forecast at once."}
+    names = ["baseline"] + [scenario.name for scenario in input.scenarios]
+    if len(set(names)) != len(names):
+        return {"error": "Scenario names must be unique and not 'baseline'."}
+    if any(change <= -1 for scenario in input.scenarios for change in scenario.shocks.values()):
+        return {"error": "Shocks are fractional changes and must be greater than -1."}
+
+    def forecast():
+        forecaster = MODEL_REGISTRY.get("market_forecaster")
+        unknown = sorted({crop for crop in input.crops if crop not in forecaster.crops} | {
+            crop for scenario in input.scenarios for crop in scenario.shocks if crop not in forecaster.crops
+        })
+        if unknown:
+            return forecaster.crops, None, unknown
+        shocks = [{}] + [scenario.shocks for scenario in input.scenarios]
+        return forecaster.crops, forecaster.forecast_scenarios(input.weeks_to_forecast, shocks), None
+
+    await ensure_model_loaded("market_forecaster")
+    all_crops, result, unknown = await INFERENCE.run("market_forecast", forecast)
+    if unknown:
+        return {"error": f"Crops not found in historical data: {', '.join(unknown)}."}
+    dates, prices = result
+    with stage("postprocess", "market_forecast"):
+        crops = input.crops or all_crops
+        columns = [all_crops.index(crop) for crop in crops]
+        forecast = {
+            name: series_payload(response_format, dates, {
+                crop: scenario_prices[:, column] for crop, column in zip(crops, columns)
+            })
+            for name, scenario_prices in zip(names, prices)
+        }
+        if response_format == "compact":
+            # Every scenario shares the dates, so they are given once
+            baseline = forecast["baseline"]
+            forecast = {"start": baseline["start"], "step_days": baseline["step_days"],
+                        "values": {name: payload["values"] for name, payload in forecast.items()}}
+    return CropixResponse({"forecast": forecast})
+
+class MarketPriceWeek(BaseModel):
+    date: str
+    prices: dict[str, float]
+
+class MarketPricesInput(BaseModel):
+    weeks: list[MarketPriceWeek]
+
+@app.post("/market_prices/")
+def append_market_prices(input: MarketPricesInput):
+    # Sync: appends fsync the store files. Forecasts pick the new weeks up on their next call.
+    try:
+        store = MODEL_REGISTRY.get("market_prices")
+        frame = pd.DataFrame(
+            [week.prices for week in input.weeks],
+            index=pd.to_datetime([week.date for week in input.weeks]),
+        )
+        appended = store.append(frame)
+    except (ValueError, FileNotFoundError) as e:
+        return {"error": str(e)}
+    return {"appended": appended, **store.status()}
 
-# Load the disease detection model and classes
-DISEASE_DETECTION_MODEL = tf.keras.models.load_model("Trained_models/CNN/Disease_Detection_model[CNN].h5")
-DISEASE_CLASSES = np.load("Trained_models/CNN/disease_classes.npy", allow_pickle=True)
\ No newline at end of file
+@app.get("/market_prices/")
+def market_prices_status():
+    try:
+        return MODEL_REGISTRY.get("market_prices").status()
+    except FileNotFoundError as e:
+        return {"error": str(e)}
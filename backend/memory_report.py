@@ -0,0 +1,55 @@
+import os
+import resource
+
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Not Linux: peak RSS is the best cheap approximation (KiB on Linux/BSD, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def process_memory():
+    """RSS plus, on Linux, how much of it is shared with other processes (e.g. forked workers)."""
+    report = {"pid": os.getpid(), "rss": current_rss()}
+    try:
+        with open("/proc/self/smaps_rollup") as rollup:
+            for line in rollup:
+                key, _, value = line.partition(":")
+                if key in _SMAPS_FIELDS:
+                    report[_SMAPS_FIELDS[key]] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return report
+
+
+def mapped_file_memory(paths, smaps_path="/proc/self/smaps"):
+    """Resident bytes of memory-mapped files (e.g. joblib arrays loaded with mmap_mode), per path."""
+    wanted = {os.path.realpath(path): path for path in paths}
+    resident = dict.fromkeys(paths, 0)
+    try:
+        with open(smaps_path) as smaps:
+            current = None
+            for line in smaps:
+                fields = line.split()
+                if fields and "-" in fields[0] and not fields[0].endswith(":"):
+                    # A mapping header; anonymous mappings have no path field
+                    current = wanted.get(fields[5]) if len(fields) >= 6 else None
+                elif current is not None and fields and fields[0] == "Rss:":
+                    resident[current] += int(fields[1]) * 1024
+    except OSError:
+        pass
+    return resident
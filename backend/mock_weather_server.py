@@ -0,0 +1,64 @@
+"""Offline stand-in for the weatherapi.com forecast endpoint.
+
+Run it next to the API and point the backend at it:
+
+    uvicorn mock_weather_server:app --port 8001
+    WEATHER_API_BASE_URL=http://127.0.0.1:8001/v1 WEATHER_API_KEY=mock uvicorn main:app
+
+Responses are deterministic per (city, day). `MOCK_WEATHER_LATENCY_MS` adds an
+artificial upstream delay, and `GET /stats` reports how many forecasts were served.
+"""
+import asyncio
+import datetime
+import os
+import random
+
+from fastapi import FastAPI, HTTPException
+
+MOCK_WEATHER_LATENCY_MS = float(os.getenv('MOCK_WEATHER_LATENCY_MS', '0'))
+CONDITIONS = ["Sunny", "Partly cloudy", "Cloudy", "Patchy rain possible", "Moderate rain"]
+
+app = FastAPI()
+request_count = 0
+
+
+def _forecast_day(city, date):
+    rng = random.Random(f"{city.casefold()}:{date.isoformat()}")
+    min_temp = round(rng.uniform(12.0, 26.0), 1)
+    max_temp = round(min_temp + rng.uniform(4.0, 12.0), 1)
+    return {
+        "date": date.isoformat(),
+        "day": {
+            "mintemp_c": min_temp,
+            "maxtemp_c": max_temp,
+            "avgtemp_c": round((min_temp + max_temp) / 2, 1),
+            "avghumidity": rng.randint(30, 95),
+            "daily_chance_of_rain": rng.randint(0, 100),
+            "condition": {"text": rng.choice(CONDITIONS)},
+        },
+    }
+
+
+@app.get("/v1/forecast.json")
+async def forecast(key: str, q: str, days: int = 1):
+    global request_count
+    request_count += 1
+
+    if not key:
+        raise HTTPException(status_code=401, detail="API key is invalid.")
+    if MOCK_WEATHER_LATENCY_MS:
+        await asyncio.sleep(MOCK_WEATHER_LATENCY_MS / 1000.0)
+
+    today = datetime.date.today()
+    days = max(1, min(days, 14))
+    return {
+        "location": {"name": q},
+        "forecast": {
+            "forecastday": [_forecast_day(q, today + datetime.timedelta(days=i)) for i in range(days)]
+        },
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": request_count}
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from memory_report import current_rss
+
+logger = logging.getLogger(__name__)
+
+# Entries currently loading, to flag RSS deltas that overlapped another load
+_ACTIVE_LOADS = set()
+_ACTIVE_LOADS_LOCK = threading.Lock()
+
+
+def _file_mtimes(paths):
+    return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+
+def _fingerprint(paths, mtimes):
+    digest = hashlib.sha1()
+    for path, mtime in zip(paths, mtimes):
+        digest.update(f"{path}:{mtime}:{os.path.getsize(path)};".encode())
+    return digest.hexdigest()[:16]
+
+
+class ModelEntry:
+    """A model (or bundle of artifacts) loaded once and reloaded when its files change."""
+
+    def __init__(self, name, paths, loader, warmup=None, check_interval=1.0, memory_paths=None):
+        self.name = name
+        self.paths = list(paths)
+        # Files whose mapped pages count towards this model in /memory/
+        self.memory_paths = list(self.paths if memory_paths is None else memory_paths)
+        self.loader = loader
+        self.warmup = warmup
+        self.check_interval = check_interval
+        self.value = None
+        self.version = None
+        self.mtimes = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.load_rss_delta = None
+        self.load_rss_approximate = False
+        self._overlapped = False
+        self.last_error = None
+        self.loading = False
+        self._current = (None, None)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads (or reloads) the artifacts and runs the warm-up hook."""
+        with self._lock:
+            return self._load_locked()
+
+    def _load_locked(self):
+        self.loading = True
+        with _ACTIVE_LOADS_LOCK:
+            # Process RSS can't be split between loads running at the same time
+            self._overlapped = bool(_ACTIVE_LOADS)
+            for entry in _ACTIVE_LOADS:
+                entry._overlapped = True
+            _ACTIVE_LOADS.add(self)
+        try:
+            mtimes = _file_mtimes(self.paths)
+            version = _fingerprint(self.paths, mtimes)
+            started = time.perf_counter()
+            rss_before = current_rss()
+            value = self.loader()
+            if self.warmup is not None:
+                self.warmup(value)
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self.loading = False
+            with _ACTIVE_LOADS_LOCK:
+                _ACTIVE_LOADS.discard(self)
+        # Swap in the new copy only once it is fully loaded and warm, so
+        # in-flight requests keep using the previous one.
+        self._current = (value, version)
+        self.value = value
+        self.version = version
+        self.mtimes = mtimes
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - started
+        self.load_rss_delta = current_rss() - rss_before
+        self.load_rss_approximate = self._overlapped
+        self.last_error = None
+        self._last_check = time.monotonic()
+        logger.info("Loaded %s in %.2fs", self.name, self.load_seconds)
+        return value
+
+    def _changed_on_disk(self):
+        try:
+            return _file_mtimes(self.paths) != self.mtimes
+        except OSError:
+            # A file is mid-replacement; keep serving the current copy.
+            return False
+
+    def get(self):
+        """Returns the shared in-memory copy, reloading it first if the files changed."""
+        return self.get_versioned()[0]
+
+    def get_versioned(self):
+        """Returns `(value, version)`, where the version fingerprints the files it was loaded from."""
+        if self.value is None:
+            with self._lock:
+                if self.value is None:
+                    self._load_locked()
+            return self._current
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return self._current
+        self._last_check = now
+
+        if self._changed_on_disk():
+            with self._lock:
+                # Another request may have reloaded while we waited for the lock.
+                if self._changed_on_disk():
+                    try:
+                        self._load_locked()
+                    except Exception:
+                        logger.exception("Reloading %s failed, serving the previous version", self.name)
+        return self._current
+
+
+class ModelRegistry:
+    """Holds every model the API serves so each is loaded once per process."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, paths, loader, warmup=None, check_interval=1.0, memory_paths=None):
+        self._entries[name] = ModelEntry(name, paths, loader, warmup, check_interval, memory_paths)
+
+    def get(self, name):
+        return self._entries[name].get()
+
+    def get_versioned(self, name):
+        return self._entries[name].get_versioned()
+
+    @property
+    def names(self):
+        return list(self._entries)
+
+    def is_loaded(self, name):
+        return self._entries[name].value is not None
+
+    def memory_paths(self):
+        """`{name: [paths]}` of mapped files, each attributed to the first model registered with it."""
+        owned = {}
+        seen = set()
+        for name, entry in self._entries.items():
+            owned[name] = [path for path in entry.memory_paths if path not in seen]
+            seen.update(owned[name])
+        return owned
+
+    def preload(self, names=None, max_workers=None):
+        """Loads the given models (default: all) concurrently.
+
+        Failures are logged rather than raised so the API can still start;
+        anything not preloaded is loaded lazily on its first request.
+        """
+        entries = [self._entries[name] for name in (self.names if names is None else names)]
+        if not entries:
+            return
+
+        def load(entry):
+            try:
+                entry.get()
+            except Exception:
+                logger.exception("Could not load %s at startup", entry.name)
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(entries), thread_name_prefix="model-loader") as pool:
+            list(pool.map(load, entries))
+
+    def status(self):
+        return {
+            name: {
+                "loaded": entry.value is not None,
+                "loading": entry.loading,
+                "version": entry.version,
+                "loaded_at": entry.loaded_at,
+                "load_seconds": entry.load_seconds,
+                "load_rss_delta": entry.load_rss_delta,
+                "load_rss_approximate": entry.load_rss_approximate,
+                "last_error": entry.last_error,
+            }
+            for name, entry in self._entries.items()
+        }
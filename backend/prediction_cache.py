@@ -0,0 +1,190 @@
+"""Content-addressed cache of disease predictions, so resubmitted photos skip the CNN.
+
+Entries are keyed on a hash of the decoded (resized RGB) pixels plus the model
+version, so the same photo re-sent by a retry or another app is recognised
+whatever its filename, and a reloaded model never serves stale answers. The
+in-memory tier is an LRU bounded by entry count; the optional SQLite tier keeps
+results across restarts and is shared by every worker of `serve.py`.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from coalescing import InflightRequests
+
+logger = logging.getLogger(__name__)
+
+
+def image_key(image, model_version):
+    """Hash of a decoded image array's pixels (and shape) under a given model version."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{model_version}:{image.shape}:{image.dtype};".encode())
+    digest.update(memoryview(image).cast("B") if image.flags.c_contiguous else image.tobytes())
+    return digest.hexdigest()
+
+
+class DiskTier:
+    """SQLite table of key -> (predicted, confidence), trimmed to the newest `max_entries`."""
+
+    def __init__(self, path, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _db(self):
+        # Connected lazily, per process: SQLite handles must not cross serve.py's fork
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            # WAL lets the workers read while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, predicted TEXT NOT NULL, confidence REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS predictions_stored_at ON predictions (stored_at)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT predicted, confidence FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def put(self, key, value):
+        predicted, confidence = value
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)", (key, predicted, confidence, time.time())
+            )
+            self._writes += 1
+            # Trimming scans the index, so it only runs every few hundred writes
+            if self._writes % 256 == 0:
+                self._trim_locked()
+
+    def _trim_locked(self):
+        self._db().execute(
+            "DELETE FROM predictions WHERE key IN ("
+            "SELECT key FROM predictions ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+class PredictionCache:
+    """Memory LRU in front of an optional DiskTier, with hit/miss counters.
+
+    `get_or_predict` also coalesces concurrent requests for the same key, so a
+    burst of identical uploads runs the model once.
+    """
+
+    def __init__(self, max_entries=10_000, disk=None, on_lookup=None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.on_lookup = on_lookup
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = InflightRequests()
+
+    def _count(self, result):
+        if self.on_lookup is not None:
+            self.on_lookup(result)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_predict(self, key, predict, run_sync):
+        """Returns the cached `(predicted, confidence)` for `key`, or awaits `predict()` and caches it.
+
+        `run_sync(fn, *args)` runs blocking disk-tier calls off the event loop.
+        """
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            self._count("memory_hit")
+            return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+            self._count("coalesced")
+        return await self._inflight.run(key, lambda: self._load(key, predict, run_sync))
+
+    async def _load(self, key, predict, run_sync):
+        value = await self._lookup_disk(key, run_sync)
+        if value is not None:
+            self.disk_hits += 1
+            self._count("disk_hit")
+        else:
+            self.misses += 1
+            self._count("miss")
+            predicted, confidence = await predict()
+            value = (str(predicted), float(confidence))
+            await self._store_disk(key, value, run_sync)
+        self._remember(key, value)
+        return value
+
+    async def _lookup_disk(self, key, run_sync):
+        if self.disk is None:
+            return None
+        try:
+            return await run_sync(self.disk.get, key)
+        except sqlite3.Error:
+            logger.exception("Disease prediction cache lookup failed")
+            return None
+
+    async def _store_disk(self, key, value, run_sync):
+        if self.disk is None:
+            return
+        try:
+            await run_sync(self.disk.put, key, value)
+        except sqlite3.Error:
+            logger.exception("Could not write to the disease prediction cache")
+
+    def clear(self):
+        self._entries.clear()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.coalesced + self.misses
+        hits = lookups - self.misses
+        return {
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_entries": None if self.disk is None else len(self.disk),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else None,
+        }
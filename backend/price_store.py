@@ -0,0 +1,342 @@
+"""Append-only store of the weekly crop price history.
+
+The CSV is parsed once, into fixed-width binary columns (`dates.i64` holds
+days since the epoch, `prices.f64` one float64 row per week), plus
+`meta.json` with the crop names, row count and per-crop min/max. After that:
+
+- New weeks are appended through `append` (or `POST /market_prices/`) without
+  rewriting or re-reading the history.
+- Rows added to the end of the CSV are picked up by parsing only the bytes
+  past the last import.
+- The min/max that define the forecaster's MinMaxScaler are updated from the
+  new rows alone.
+- Readers only ever load the last few rows (`window`), never the full history.
+
+`meta.json` is replaced atomically after the data files are written, so its
+row count is the commit point: bytes past it (from an interrupted append) are
+ignored and overwritten by the next append.
+
+If the CSV is rewritten rather than appended to, the store is rebuilt from it.
+Weeks that only ever came through `append` are merged back in, unless the
+rewritten CSV has a row for the same date.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def _head_hash(path, size):
+    # Identifies the part of the CSV already imported, to tell appends from rewrites
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(min(size, 1 << 16))).hexdigest()
+
+
+@contextmanager
+def _file_lock(path):
+    # Serializes writers across serve.py workers; the lock is released when the file closes
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class PriceWindow:
+    """The latest `n` weeks of prices and the scaling bounds, as of one store revision."""
+
+    def __init__(self, crops, dates, prices, data_min, data_max, revision):
+        self.crops = crops
+        self.dates = dates
+        self.prices = prices
+        self.data_min = data_min
+        self.data_max = data_max
+        self.revision = revision
+
+    @property
+    def last_date(self):
+        return self.dates[-1]
+
+    def scaler(self):
+        """A MinMaxScaler equal to one fitted on the full history."""
+        return MinMaxScaler(feature_range=(0, 1)).partial_fit(np.vstack([self.data_min, self.data_max]))
+
+
+class PriceStore:
+    def __init__(self, directory, csv_path=None, check_interval=1.0):
+        self.directory = directory
+        self.csv_path = csv_path
+        self.check_interval = check_interval
+        self.meta = None
+        self._meta_mtime = None
+        self._tail = None  # (n, dates, prices) read for the current meta
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, directory, csv_path=None):
+        """Opens the store, importing `csv_path` the first time and any rows added to it since."""
+        store = cls(directory, csv_path)
+        store.refresh(force=True)
+        if store.meta is None:
+            raise FileNotFoundError(f"No price store in {directory} and no CSV to import it from")
+        return store
+
+    # Files
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            stat = os.stat(self._path("meta.json"))
+        except FileNotFoundError:
+            return
+        # meta.json is replaced, never rewritten in place, so a new inode means a new revision
+        mtime = (stat.st_ino, stat.st_mtime_ns)
+        if mtime != self._meta_mtime:
+            with open(self._path("meta.json")) as f:
+                meta = json.load(f)
+            if meta.get("version") != STORE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported price store version in {self.directory}")
+            self.meta, self._meta_mtime, self._tail = meta, mtime, None
+
+    def _write_meta(self, meta):
+        meta = {**meta, "revision": meta.get("revision", 0) + 1, "version": STORE_FORMAT_VERSION}
+        temporary = self._path(f"meta.json.{os.getpid()}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(meta, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._path("meta.json"))
+        self._read_meta()
+
+    def _exclusive(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return _file_lock(self._path(".lock"))
+
+    # Writing
+
+    def _append_arrays(self, dates, prices, from_api=False):
+        """Appends validated rows to the column files and commits them in meta.json.
+
+        Dates of rows that didn't come from the CSV are listed in meta.json, so a
+        rebuild from a rewritten CSV can keep them.
+        """
+        meta = self.meta
+        n_crops = len(meta["crops"])
+        with open(self._path("dates.i64"), "r+b") as f:
+            f.truncate(meta["rows"] * 8)  # drop any uncommitted bytes
+            f.seek(0, os.SEEK_END)
+            f.write((dates - _EPOCH).astype("<i8").tobytes())
+            os.fsync(f.fileno())
+        with open(self._path("prices.f64"), "r+b") as f:
+            f.truncate(meta["rows"] * n_crops * 8)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(prices, dtype="<f8").tobytes())
+            os.fsync(f.fileno())
+        self._write_meta({
+            **meta,
+            "rows": meta["rows"] + len(dates),
+            "last_date": str(dates[-1]),
+            "data_min": np.minimum(meta["data_min"], prices.min(axis=0)).tolist(),
+            "data_max": np.maximum(meta["data_max"], prices.max(axis=0)).tolist(),
+            "api_dates": meta.get("api_dates", []) + ([str(date) for date in dates] if from_api else []),
+        })
+
+    @staticmethod
+    def _check_rows(dates, prices):
+        if not np.isfinite(prices).all():
+            raise ValueError("Prices must be finite numbers.")
+        if len(dates) > 1 and np.any(np.diff(dates) <= np.timedelta64(0, "D")):
+            raise ValueError("Dates must be in increasing order.")
+
+    def _append_frame(self, frame, from_api=False):
+        missing = [crop for crop in self.meta["crops"] if crop not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing prices for: {', '.join(missing)}")
+        dates = pd.DatetimeIndex(frame.index).values.astype("datetime64[D]")
+        prices = frame[self.meta["crops"]].to_numpy(dtype=np.float64)
+        self._check_rows(dates, prices)
+        last_date = np.datetime64(self.meta["last_date"], "D")
+        if len(dates) and dates[0] <= last_date:
+            raise ValueError(f"New rows must be dated after the last stored week ({last_date}).")
+        if len(dates):
+            self._append_arrays(dates, prices, from_api)
+        return len(dates)
+
+    def append(self, frame):
+        """Appends a DataFrame indexed by date with one column per crop; returns the number of rows added."""
+        with self._lock, self._exclusive():
+            self._read_meta()
+            return self._append_frame(frame, from_api=True)
+
+    def _read_rows(self, start, count):
+        n_crops = len(self.meta["crops"])
+        days = np.fromfile(self._path("dates.i64"), dtype="<i8", count=count, offset=start * 8)
+        prices = np.fromfile(self._path("prices.f64"), dtype="<f8", count=count * n_crops,
+                             offset=start * n_crops * 8).reshape(count, n_crops)
+        return _EPOCH + days.astype("timedelta64[D]"), prices
+
+    def _api_rows(self):
+        """The rows added through `append`, as a DataFrame indexed by date (None if there are none)."""
+        if not self.meta or not self.meta.get("api_dates"):
+            return None
+        dates, prices = self._read_rows(0, self.meta["rows"])
+        keep = np.isin(dates, np.array(self.meta["api_dates"], dtype="datetime64[D]"))
+        return pd.DataFrame(prices[keep], index=pd.DatetimeIndex(dates[keep].astype("datetime64[ns]")),
+                            columns=self.meta["crops"])
+
+    def _import_csv(self, stat):
+        """Builds the store from the whole CSV (first run, or when the CSV was rewritten)."""
+        api_rows = self._api_rows()
+        with open(self.csv_path, "rb") as f:
+            raw = f.read()
+        # Only complete lines count; a row still being written is picked up next time
+        offset = raw.rfind(b"\n") + 1 or len(raw)
+        frame = pd.read_csv(io.BytesIO(raw[:offset]), index_col="Date", parse_dates=True)
+        api_rows = self._merge_api_rows(frame, api_rows)
+        api_dates = []
+        if api_rows is not None:
+            api_dates = [str(date) for date in api_rows.index.values.astype("datetime64[D]")]
+            frame = pd.concat([frame, api_rows[frame.columns]]).sort_index()
+        dates = frame.index.values.astype("datetime64[D]")
+        prices = frame.to_numpy(dtype=np.float64)
+        for name in ("dates.i64", "prices.f64"):
+            open(self._path(name), "wb").close()
+        revision = self.meta["revision"] if self.meta else 0
+        self.meta = {
+            "crops": list(frame.columns), "rows": 0, "first_date": str(dates[0]), "last_date": str(dates[0]),
+            "data_min": prices.min(axis=0).tolist(), "data_max": prices.max(axis=0).tolist(),
+            "csv_header": raw[:raw.find(b"\n") + 1].decode(), "csv_offset": offset,
+            "csv_head_hash": _head_hash(self.csv_path, offset), "csv_mtime_ns": stat.st_mtime_ns,
+            "api_dates": api_dates,
+            "revision": revision,
+        }
+        self._check_rows(dates, prices)
+        self._append_arrays(dates, prices)
+
+    @staticmethod
+    def _merge_api_rows(frame, api_rows):
+        """The API-appended rows to keep alongside a re-imported CSV `frame`, or None."""
+        if api_rows is None:
+            return None
+        # Weeks the CSV has a row for are taken from the CSV
+        superseded = api_rows.index.isin(frame.index)
+        if superseded.any():
+            logger.warning("%d week(s) appended through the API are superseded by the rewritten CSV",
+                           int(superseded.sum()))
+        kept = api_rows[~superseded]
+        missing = [crop for crop in frame.columns if crop not in kept.columns]
+        if len(kept) and missing:
+            logger.error("Could not keep %d week(s) appended through the API: missing prices for %s",
+                         len(kept), ", ".join(missing))
+            return None
+        return kept if len(kept) else None
+
+    def _csv_changed(self, stat):
+        meta = self.meta
+        return meta is None or (stat.st_size, stat.st_mtime_ns) != (meta.get("csv_offset"), meta.get("csv_mtime_ns"))
+
+    def _sync_csv(self):
+        """Imports rows added to the end of the CSV since the last sync, parsing only those bytes."""
+        stat = os.stat(self.csv_path)
+        if not self._csv_changed(stat):
+            return
+        meta = self.meta
+        size = stat.st_size
+        if meta is not None and "csv_mtime_ns" not in meta and size == meta.get("csv_offset"):
+            # Stores from before mtimes were recorded
+            self._write_meta({**meta, "csv_mtime_ns": stat.st_mtime_ns})
+            return
+        # Same size but a new mtime is an in-place edit, which the head hash can miss
+        if meta is None or "csv_offset" not in meta or size <= meta["csv_offset"] or \
+                _head_hash(self.csv_path, meta["csv_offset"]) != meta["csv_head_hash"]:
+            self._import_csv(stat)
+            return
+
+        with open(self.csv_path, "rb") as f:
+            f.seek(meta["csv_offset"])
+            new = f.read()
+        complete = new.rfind(b"\n") + 1
+        if not complete:
+            return
+        frame = pd.read_csv(io.StringIO(meta["csv_header"] + new[:complete].decode()),
+                            index_col="Date", parse_dates=True)
+        # Weeks already added through the API are not duplicated
+        frame = frame[frame.index > pd.Timestamp(meta["last_date"])]
+        if len(frame):
+            self._append_frame(frame)
+        offset = meta["csv_offset"] + complete
+        # The head hash covers the imported bytes, so it moves with the offset
+        self._write_meta({**self.meta, "csv_offset": offset, "csv_head_hash": _head_hash(self.csv_path, offset),
+                          "csv_mtime_ns": stat.st_mtime_ns})
+
+    def refresh(self, force=False):
+        """Picks up appends by other processes and new CSV rows, at most once per `check_interval`."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        with self._lock:
+            self._read_meta()
+            if self.csv_path and os.path.exists(self.csv_path):
+                if self._csv_changed(os.stat(self.csv_path)):
+                    with self._exclusive():
+                        self._read_meta()
+                        self._sync_csv()
+
+    # Reading
+
+    @property
+    def crops(self):
+        return list(self.meta["crops"])
+
+    @property
+    def revision(self):
+        return self.meta["revision"]
+
+    def window(self, n):
+        """The last `n` weeks as a PriceWindow, read from the end of the column files."""
+        self.refresh()
+        with self._lock:
+            meta = self.meta
+            cached = self._tail
+            if cached is None or cached[0] != n:
+                count = min(n, meta["rows"])
+                dates, prices = self._read_rows(meta["rows"] - count, count)
+                dates = pd.DatetimeIndex(dates.astype("datetime64[ns]"))
+                cached = self._tail = (n, dates, prices)
+            _, dates, prices = cached
+            return PriceWindow(self.crops, dates, prices, np.array(meta["data_min"]), np.array(meta["data_max"]),
+                               meta["revision"])
+
+    def status(self):
+        self.refresh()
+        meta = self.meta
+        return {
+            "crops": meta["crops"],
+            "rows": meta["rows"],
+            "first_date": meta["first_date"],
+            "last_date": meta["last_date"],
+            "revision": meta["revision"],
+            "min": dict(zip(meta["crops"], meta["data_min"])),
+            "max": dict(zip(meta["crops"], meta["data_max"])),
+        }
@@ -0,0 +1,150 @@
+"""Response encoding: orjson for JSON, MessagePack on request, and compact forecast payloads.
+
+`CropixResponse` is the app's default response class. It renders with orjson
+(NumPy arrays and scalars, datetimes and Timestamp keys included) and falls
+back to the standard library when orjson isn't installed. A client that sends
+`Accept: application/msgpack` gets the same content as MessagePack, if the
+`msgpack` package is installed.
+
+Endpoints that return large payloads return a `CropixResponse` themselves,
+which skips FastAPI's `jsonable_encoder` pass over the content.
+"""
+import contextvars
+import datetime
+import json
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+from instrumentation import stage
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+RESPONSE_FORMATS = ("records", "compact")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_wants_msgpack = contextvars.ContextVar("wants_msgpack", default=False)
+
+
+def _default(value):
+    # Types orjson doesn't handle natively, and everything non-native for json/msgpack
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _json_key(key):
+    return key.isoformat() if isinstance(key, (datetime.datetime, datetime.date)) else key
+
+
+def _stringify_keys(value):
+    if isinstance(value, dict):
+        return {_json_key(key): _stringify_keys(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stringify_keys(item) for item in value]
+    return value
+
+
+def dumps(content):
+    """JSON bytes for `content`."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Keys orjson can't take (e.g. pandas Timestamps) are converted and the render retried
+            return orjson.dumps(_stringify_keys(content), default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_stringify_keys(content), default=_default, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def dumps_line(content):
+    """One NDJSON line (str) for streamed results."""
+    return dumps(content).decode("utf-8") + "\n"
+
+
+def pack(content):
+    """MessagePack bytes for `content`."""
+    return msgpack.packb(_stringify_keys(content), default=_default, use_bin_type=True)
+
+
+def wants_msgpack(accept):
+    return any(media_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES for media_type in accept.split(","))
+
+
+class ContentNegotiationMiddleware:
+    """Records whether the client asked for MessagePack, for CropixResponse to pick up."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1")
+                break
+        token = _wants_msgpack.set(msgpack is not None and wants_msgpack(accept))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _wants_msgpack.reset(token)
+
+
+class CropixResponse(JSONResponse):
+    """orjson (or negotiated MessagePack) response; rendering is recorded as the `serialize` stage."""
+
+    def init_headers(self, headers=None):
+        super().init_headers(headers)
+        # Caches must keep JSON and MessagePack bodies apart
+        self.raw_headers.append((b"vary", b"Accept"))
+
+    def render(self, content):
+        with stage("serialize"):
+            if _wants_msgpack.get():
+                self.media_type = MSGPACK_MEDIA_TYPES[0]
+                return pack(content)
+            return dumps(content)
+
+
+def records_series(dates, columns, decimals=2):
+    """`{name: {ISO timestamp: value}}`, the long-standing forecast layout."""
+    keys = [date.isoformat() for date in dates]
+    return {
+        name: dict(zip(keys, np.round(np.asarray(values, dtype=np.float64), decimals).tolist()))
+        for name, values in columns.items()
+    }
+
+
+def compact_series(dates, columns, decimals=2):
+    """`{"start", "step_days", "values": {name: [...]}}` for regularly spaced series sharing `dates`.
+
+    Replaces one timestamp key per value with a start date and a fixed step.
+    """
+    step_days = int((dates[1] - dates[0]) / np.timedelta64(1, "D")) if len(dates) > 1 else 7
+    return {
+        "start": dates[0].date().isoformat(),
+        "step_days": step_days,
+        "values": {name: np.round(np.asarray(values, dtype=np.float64), decimals).tolist()
+                   for name, values in columns.items()},
+    }
+
+
+def series_payload(response_format, dates, columns, decimals=2):
+    """`columns` ({name: 1-D array} over `dates`) in the requested format, rounded in float64."""
+    if response_format == "compact":
+        return compact_series(dates, columns, decimals)
+    return records_series(dates, columns, decimals)
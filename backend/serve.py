@@ -0,0 +1,109 @@
+"""Preforking server for running several CROPIX workers on one machine.
+
+    python serve.py --workers 4 --port 8000
+
+The parent imports the app and loads the scikit-learn/XGBoost models once, then
+forks the uvicorn workers, which inherit those models copy-on-write instead of
+each loading its own copy (joblib arrays are additionally memory-mapped, see
+JOBLIB_MMAP_MODE in main.py). The TensorFlow models are still loaded inside each
+worker after the fork: the TensorFlow runtime starts threads that do not survive
+fork() safely. GET /memory/ on any worker shows how much of its RSS is shared.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+logger = logging.getLogger("cropix.serve")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run CROPIX with preforked workers sharing loaded models.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def bind_socket(host, port):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, args):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=args.log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+
+    import main as cropix
+
+    shared = [name for name in cropix.PRELOAD_MODEL_NAMES if name not in cropix.TENSORFLOW_MODEL_NAMES]
+    logger.info("Loading %s in the parent process", ", ".join(shared) or "no models")
+    cropix.MODEL_REGISTRY.preload(shared)
+
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers don't write to (and therefore un-share) the inherited pages.
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    workers = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(cropix.app, sock, args)
+            finally:
+                os._exit(0)
+        workers.add(pid)
+        logger.info("Started worker %d", pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Serving on %s:%d with %d workers", args.host, args.port, args.workers)
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+            time.sleep(1)  # don't spin if workers die on startup
+            spawn()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Top-k soil/crop recommendations from a prebuilt index over the KNN model's training points.
+
+The index is derived from `Soil_crop_recom.joblib` and saved next to it, tagged
+with a hash of the model file so it is rebuilt whenever the model changes:
+
+    python soil_index.py    # build/refresh Trained_models/Soil_crop_recom.index.joblib
+"""
+import hashlib
+import logging
+import os
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+from sklearn.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_index_path(model_path):
+    return os.path.splitext(model_path)[0] + ".index.joblib"
+
+
+class SoilCropIndex:
+    """KD-trees over the KNN classifier's training points, queried in batches.
+
+    `tree` holds every training point and reproduces the classifier's vote:
+    `probability` matches `predict_proba`, and the top crop is the one
+    `/recommend_soil_crop/` returns, except that tied votes go to the nearer
+    crop rather than the first in class order. One tree per crop gives the
+    distance from a sample to the nearest field where that crop was grown,
+    which ranks the crops outside the k-neighbour vote instead of leaving them
+    tied at zero.
+    """
+
+    def __init__(self, tree, class_trees, labels, classes, n_neighbors, weights="uniform", preprocessor=None,
+                 feature_names=None, source_hash=None, version=INDEX_FORMAT_VERSION):
+        self.tree = tree
+        self.class_trees = class_trees
+        self.labels = np.asarray(labels)
+        self.classes = np.asarray(classes)
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.preprocessor = preprocessor
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.source_hash = source_hash
+        self.version = version
+
+    @classmethod
+    def from_model(cls, model, source_hash=None):
+        preprocessor = None
+        if isinstance(model, Pipeline):
+            preprocessor, model = model[:-1], model.steps[-1][1]
+        if getattr(model, "effective_metric_", None) != "euclidean" or callable(model.weights):
+            raise ValueError("Only euclidean KNN classifiers with uniform/distance weights can be indexed")
+
+        points = np.asarray(model._fit_X, dtype=np.float64)
+        labels = np.asarray(model._y)
+        return cls(
+            KDTree(points, leaf_size=model.leaf_size),
+            [KDTree(points[labels == index], leaf_size=model.leaf_size) for index in range(len(model.classes_))],
+            labels,
+            model.classes_,
+            model.n_neighbors,
+            weights=model.weights,
+            preprocessor=preprocessor,
+            feature_names=getattr(model, "feature_names_in_", None),
+            source_hash=source_hash,
+        )
+
+    def save(self, path):
+        # Saved as a plain dict of sklearn/NumPy objects so loading never depends on this module's path
+        joblib.dump(dict(self.__dict__), path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(**joblib.load(path))
+
+    def _transform(self, samples):
+        if self.preprocessor is not None:
+            return np.asarray(self.preprocessor.transform(samples), dtype=np.float64)
+        return np.asarray(samples, dtype=np.float64)
+
+    def probabilities(self, points):
+        """The classifier's class probabilities for already-transformed points."""
+        distances, indices = self.tree.query(points, k=self.n_neighbors)
+        if self.weights == "distance":
+            with np.errstate(divide="ignore"):
+                votes = 1.0 / distances
+            # An exact match takes the whole vote, as in KNeighborsClassifier
+            exact = np.isinf(votes)
+            votes = np.where(exact.any(axis=1, keepdims=True), exact.astype(np.float64), votes)
+        else:
+            votes = np.ones_like(distances)
+        probabilities = np.zeros((len(points), len(self.classes)))
+        np.add.at(probabilities, (np.arange(len(points))[:, None], self.labels[indices]), votes)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def class_distances(self, points):
+        """Distance from each point to the nearest training sample of every crop, (n, classes)."""
+        return np.column_stack([tree.query(points, k=1)[0][:, 0] for tree in self.class_trees])
+
+    def top_k(self, samples, k=3):
+        """Ranks crops for each sample by vote probability, then by distance to the nearest field.
+
+        `samples` is an (n, features) array or DataFrame in the model's feature
+        order. Returns (crop indices, probabilities, distances), each (n, k).
+        """
+        k = min(k, len(self.classes))
+        points = self._transform(samples)
+        probabilities = self.probabilities(points)
+        distances = self.class_distances(points)
+        # lexsort sorts by the last key first: probability (descending), then distance
+        order = np.lexsort((distances, -probabilities), axis=1)[:, :k]
+        return (
+            order,
+            np.take_along_axis(probabilities, order, axis=1),
+            np.take_along_axis(distances, order, axis=1),
+        )
+
+    def recommend(self, samples, k=3):
+        """top_k as a list (one per sample) of [{"crop", "probability", "distance"}, ...]."""
+        order, probabilities, distances = self.top_k(samples, k)
+        return [
+            [
+                {"crop": str(self.classes[index]), "probability": float(probability), "distance": float(distance)}
+                for index, probability, distance in zip(row_order, row_probabilities, row_distances)
+            ]
+            for row_order, row_probabilities, row_distances in zip(order, probabilities, distances)
+        ]
+
+
+def load_or_build_index(model_path, index_path=None):
+    """Loads the persisted index, rebuilding (and re-saving) it if it is missing or stale."""
+    index_path = index_path or default_index_path(model_path)
+    source_hash = _file_hash(model_path)
+    if os.path.exists(index_path):
+        try:
+            index = SoilCropIndex.load(index_path)
+            if index.source_hash == source_hash and index.version == INDEX_FORMAT_VERSION:
+                return index
+        except Exception:
+            logger.exception("Could not read %s, rebuilding it", index_path)
+
+    index = SoilCropIndex.from_model(joblib.load(model_path), source_hash=source_hash)
+    try:
+        index.save(index_path)
+    except OSError:
+        # A read-only model directory only costs a rebuild on the next start
+        logger.warning("Could not save the soil crop index to %s", index_path)
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'Trained_models/Soil_crop_recom.joblib'
+    index = load_or_build_index(model_path)
+    model = joblib.load(model_path)
+    samples = model._fit_X + np.random.default_rng(0).normal(0, 5, model._fit_X.shape)
+    order, _, _ = index.top_k(samples, k=1)
+    matches = np.mean(index.classes[order[:, 0]] == model.predict(samples))
+    print(f"Index saved to {default_index_path(model_path)}; top-1 matches the model on {matches:.1%} of samples")
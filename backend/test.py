@@ -1,4 +1,9 @@
 import os
+import sys
+import argparse
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import joblib
 import pandas as pd
 import numpy as np
@@ -22,7 +27,10 @@ except ImportError:
 
 from tensorflow.keras.models import load_model # type: ignore
 from tensorflow.keras.preprocessing import image # type: ignore
-from sklearn.preprocessing import MinMaxScaler
+
+from field_advisory import season_category
+from forecasting import MarketForecaster
+from price_store import PriceStore
 
 # --- CONFIGURATION ---
 # Paths to the saved models based on the provided directory structure
@@ -33,6 +41,7 @@ DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
 DISEASE_CLASSES_PATH = 'Trained_models/CNN/disease_classes.npy'
 MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
 MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv' # Required for the scaler
+MARKET_STORE_DIR = 'Datasets/price_store' # Binary copy of the CSV, shared with the API
 
 # Load environment variables for the Weather API
 load_dotenv()
@@ -65,6 +74,35 @@ def get_int_input(prompt):
         except ValueError:
             print("[Error] Invalid input. Please enter a valid whole number.")
 
+@functools.lru_cache(maxsize=None)
+def load_joblib_model(path):
+    """Loads a joblib model once per session; later menu choices and batch runs reuse it."""
+    return joblib.load(path)
+
+@functools.lru_cache(maxsize=None)
+def load_keras_model(path):
+    """Loads a Keras model once per session."""
+    return load_model(path)
+
+@functools.lru_cache(maxsize=None)
+def load_disease_classes(path):
+    """Loads the disease class names once per session."""
+    return np.load(path, allow_pickle=True)
+
+@functools.lru_cache(maxsize=None)
+def load_tflite_backend(path):
+    """Opens a TFLite disease model once per session."""
+    from disease_backends import TFLiteBackend
+    return TFLiteBackend.load(path)
+
+@functools.lru_cache(maxsize=None)
+def load_market_forecaster():
+    """Loads the LSTM (and traces its rollout) once per session.
+
+    The price store re-checks the CSV on every forecast, so new rows are still picked up.
+    """
+    return MarketForecaster.load(MARKET_MODEL_PATH, PriceStore.open(MARKET_STORE_DIR, MARKET_DATA_PATH))
+
 # --- MODEL INFERENCE FUNCTIONS ---
 
 def predict_crop_yield():
@@ -74,12 +112,12 @@ def predict_crop_yield():
         return
 
     try:
-        model = joblib.load(CROP_YIELD_MODEL_PATH)
+        model = load_joblib_model(CROP_YIELD_MODEL_PATH)
         
         # Get user input for all required features
         crop = input("Enter Crop Name (e.g., Rice, Wheat): ")
         crop_year = get_int_input("Enter Crop Year (e.g., 2020): ")
-        season = input("Enter Season (e.g., Kharif, Rabi): ")
+        season = season_category(input("Enter Season (e.g., Kharif, Rabi): "))
         area = get_float_input("Enter Area in Hectares: ")
         annual_rainfall = get_float_input("Enter Annual Rainfall (in mm): ")
         fertilizer = get_float_input("Enter total Fertilizer usage (in tonnes): ")
@@ -115,8 +153,8 @@ def predict_disease():
         return
 
     try:
-        model = load_model(DISEASE_MODEL_PATH)
-        class_names = np.load(DISEASE_CLASSES_PATH, allow_pickle=True)
+        model = load_keras_model(DISEASE_MODEL_PATH)
+        class_names = load_disease_classes(DISEASE_CLASSES_PATH)
 
         img_path = input("Enter the full path to the plant image file: ")
         if not check_file_exists(img_path):
@@ -148,7 +186,7 @@ def recommend_fertilizer():
         return
 
     try:
-        model = joblib.load(FERTILIZER_MODEL_PATH)
+        model = load_joblib_model(FERTILIZER_MODEL_PATH)
 
         # Get user input
         crop = input("Enter Crop Name (e.g., Rice, Wheat): ")
@@ -179,46 +217,23 @@ def forecast_market_prices():
         return
 
     try:
-        model = load_model(MARKET_MODEL_PATH)
-        df_historical = pd.read_csv(MARKET_DATA_PATH, index_col='Date', parse_dates=True)
+        forecaster = load_market_forecaster()
 
         # --- Get User Input ---
         print("Available crops for forecasting:")
-        print(", ".join(df_historical.columns))
+        print(", ".join(forecaster.crops))
         while True:
             crop_name = input("Enter the crop name you want to forecast: ")
-            if crop_name in df_historical.columns:
+            if crop_name in forecaster.crops:
                 break
             else:
                 print(f"[Error] Invalid crop name. Please choose from the list above.")
 
         weeks_to_forecast = get_int_input("Enter the number of weeks to forecast ahead: ")
 
-        # --- Scale Data and Predict ---
-        scaler = MinMaxScaler(feature_range=(0, 1))
-        scaled_data = scaler.fit_transform(df_historical)
-
-        n_steps = 8 # This must match the model's training configuration
-        n_features = df_historical.shape[1]
-
-        # Prepare the last known data from the historical dataset as the starting point
-        last_known_data = scaled_data[-n_steps:]
-        current_batch = last_known_data.reshape((1, n_steps, n_features))
-        forecast = []
-
-        # Make predictions week by week
-        for _ in range(weeks_to_forecast):
-            current_pred = model.predict(current_batch, verbose=0)[0]
-            forecast.append(current_pred)
-            current_batch = np.append(current_batch[:, 1:, :], [[current_pred]], axis=1)
-
-        # Inverse transform to get actual price values
-        forecast_prices = scaler.inverse_transform(forecast)
-
-        # Create a DataFrame for the full forecast
-        last_historical_date = df_historical.index[-1]
-        future_dates = pd.to_datetime([last_historical_date + pd.Timedelta(weeks=i) for i in range(1, weeks_to_forecast + 1)])
-        df_forecast = pd.DataFrame(forecast_prices, index=future_dates, columns=df_historical.columns)
+        # --- Predict ---
+        # The whole multi-week rollout runs as a single compiled TensorFlow call
+        df_forecast = forecaster.forecast(weeks_to_forecast)
 
         print(f"\n--- Forecasted Prices for {crop_name} (INR per Quintal) ---")
         # Display only the requested crop's forecast
@@ -235,7 +250,7 @@ def recommend_soil_crop():
         return
         
     try:
-        model = joblib.load(SOIL_CROP_MODEL_PATH)
+        model = load_joblib_model(SOIL_CROP_MODEL_PATH)
         
         # Get user input
         n = get_float_input("Enter Nitrogen (N) level in soil: ")
@@ -298,6 +313,222 @@ def get_weather_forecast():
         print("\n[Error] Invalid input or unexpected API response.")
 
 
+# --- BATCH SCORING ---
+
+TABULAR_MODEL_PATHS = {
+    'crop_yield': CROP_YIELD_MODEL_PATH,
+    'soil_crop': SOIL_CROP_MODEL_PATH,
+    'fertilizer': FERTILIZER_MODEL_PATH,
+}
+# Output column names match the API's batch endpoints
+PREDICTION_COLUMNS = {
+    'crop_yield': ['predicted_yield'],
+    'soil_crop': ['recommended_crop'],
+    'fertilizer': ['recommended_N', 'recommended_P', 'recommended_K'],
+}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def iter_table_chunks(path, chunk_size):
+    """Yields DataFrames of at most `chunk_size` rows from a CSV or Parquet file."""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def iter_image_chunks(directory, chunk_size):
+    """Yields DataFrames with a `path` column for every image under `directory`, in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+                if len(paths) == chunk_size:
+                    yield pd.DataFrame({'path': paths})
+                    paths = []
+    if paths:
+        yield pd.DataFrame({'path': paths})
+
+
+def make_tabular_scorer(name, keep_columns=True):
+    """Loads the model once and returns a function that scores one DataFrame chunk."""
+    model = load_joblib_model(TABULAR_MODEL_PATHS[name])
+    columns = list(model.feature_names_in_)
+    outputs = PREDICTION_COLUMNS[name]
+
+    def score(chunk):
+        missing = [column for column in columns if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+        features = chunk[columns]
+        if 'Season' in columns:
+            # Same normalisation as the API's yield endpoints
+            features = features.assign(Season=features['Season'].astype(str).map(season_category))
+        predictions = np.asarray(model.predict(features)).reshape(len(chunk), -1)
+        result = chunk.copy() if keep_columns else pd.DataFrame(index=chunk.index)
+        for index, column in enumerate(outputs):
+            result[column] = predictions[:, index]
+        return result
+
+    return score
+
+
+def make_disease_scorer(backend_name='keras', tflite_path=None):
+    """Returns a function that classifies a chunk of image paths in one model call.
+
+    Unreadable images get an `error` instead of failing the whole run.
+    """
+    from disease_backends import KerasBackend
+    from image_preprocessing import decode_image
+
+    if backend_name == 'tflite':
+        backend = load_tflite_backend(tflite_path)
+    else:
+        backend = KerasBackend(load_keras_model(DISEASE_MODEL_PATH))
+    class_names = load_disease_classes(DISEASE_CLASSES_PATH)
+
+    def score(chunk):
+        images, errors = [], []
+        for path in chunk['path']:
+            try:
+                with open(path, 'rb') as f:
+                    images.append(decode_image(f.read()))
+                errors.append('')
+            except Exception as e:
+                images.append(None)
+                errors.append(str(e))
+
+        predicted = [''] * len(images)
+        confidence = [np.nan] * len(images)
+        decoded = [index for index, img in enumerate(images) if img is not None]
+        if decoded:
+            batch = np.stack([images[index] for index in decoded]).astype(np.float32) / 255.0
+            probabilities = backend.predict(batch)
+            for index, row in zip(decoded, probabilities):
+                predicted[index] = str(class_names[np.argmax(row)])
+                confidence[index] = float(np.max(row))
+        return pd.DataFrame({
+            'path': chunk['path'].values,
+            'predicted_disease': predicted,
+            'confidence': confidence,
+            'error': errors,
+        })
+
+    return score
+
+
+class PredictionWriter:
+    """Appends scored chunks to a CSV, JSON Lines or Parquet file as they complete."""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = {'.parquet': 'parquet', '.pq': 'parquet', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(
+            os.path.splitext(path)[1].lower(), 'csv'
+        )
+        self.file = None
+        self.parquet_writer = None
+        self.schema = None
+
+    def write(self, frame):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Later chunks are cast to the first chunk's schema (e.g. an int column that gains a NaN)
+            table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+            if self.parquet_writer is None:
+                self.schema = table.schema
+                self.parquet_writer = pq.ParquetWriter(self.path, self.schema)
+            self.parquet_writer.write_table(table)
+            return
+        first = self.file is None
+        if first:
+            self.file = open(self.path, 'w', newline='')
+        if self.format == 'jsonl':
+            lines = frame.to_json(orient='records', lines=True)
+            self.file.write(lines if not lines or lines.endswith('\n') else lines + '\n')
+        else:
+            frame.to_csv(self.file, header=first, index=False)
+        self.file.flush()
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.file is not None:
+            self.file.close()
+
+
+def score_chunks(score, chunks, writer, workers=2):
+    """Scores chunks on a worker pool and writes them in input order.
+
+    At most `workers + 1` chunks are held in memory at any time, so the input
+    can be far larger than RAM.
+    """
+    rows = 0
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunks:
+            in_flight.append(pool.submit(score, chunk))
+            while len(in_flight) > workers:
+                rows += _write_next(in_flight, writer, rows)
+        while in_flight:
+            rows += _write_next(in_flight, writer, rows)
+    return rows
+
+
+def _write_next(in_flight, writer, rows_so_far):
+    result = in_flight.popleft().result()
+    writer.write(result)
+    print(f"Scored {rows_so_far + len(result)} rows", file=sys.stderr, flush=True)
+    return len(result)
+
+
+def run_batch(args):
+    """Entry point for `python test.py score ...`."""
+    if args.model == 'disease':
+        if not os.path.isdir(args.input):
+            print(f"[Error] The disease model expects a directory of images, got: {args.input}")
+            return 1
+        score = make_disease_scorer(args.disease_backend, args.tflite_path)
+        chunks = iter_image_chunks(args.input, args.chunk_size or 64)
+    else:
+        if not check_file_exists(args.input) or not check_file_exists(TABULAR_MODEL_PATHS[args.model]):
+            return 1
+        score = make_tabular_scorer(args.model, keep_columns=not args.predictions_only)
+        chunks = iter_table_chunks(args.input, args.chunk_size or 10000)
+
+    writer = PredictionWriter(args.output)
+    try:
+        rows = score_chunks(score, chunks, writer, args.workers)
+    except ValueError as e:
+        print(f"[Error] {e}")
+        return 1
+    finally:
+        writer.close()
+    print(f"Wrote {rows} predictions to {args.output}")
+    return 0
+
+
+def parse_batch_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Score a CSV/Parquet file (or a directory of leaf images) without the interactive menu."
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    score = commands.add_parser('score', help='batch-score a file or image directory')
+    score.add_argument('model', choices=[*TABULAR_MODEL_PATHS, 'disease'])
+    score.add_argument('input', help='CSV/Parquet file, or an image directory for the disease model')
+    score.add_argument('-o', '--output', required=True, help='output file: .csv, .jsonl or .parquet')
+    score.add_argument('--chunk-size', type=int, help='rows (default 10000) or images (default 64) per model call')
+    score.add_argument('--workers', type=int, default=2, help='chunks scored concurrently')
+    score.add_argument('--predictions-only', action='store_true', help="don't copy the input columns to the output")
+    score.add_argument('--disease-backend', choices=['keras', 'tflite'], default='keras')
+    score.add_argument('--tflite-path', default='Trained_models/CNN/Disease_Detection_model[CNN].tflite')
+    return parser.parse_args(argv)
+
+
 # --- MAIN CLI ---
 
 def main():
@@ -339,5 +570,8 @@ def main():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # e.g. python test.py score crop_yield surveys.csv -o yields.csv
+        sys.exit(run_batch(parse_batch_args(sys.argv[1:])))
     main()
 
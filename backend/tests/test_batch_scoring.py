@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.requests import Request
+
+from batch_scoring import read_batch
+
+
+class Record(BaseModel):
+    N: float
+    label: str
+
+
+def make_request(body, headers=(), chunk_size=16):
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)] or [b""]
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "query_string": b"",
+             "headers": [(b"content-type", b"application/json")] + list(headers)}
+    return Request(scope, receive)
+
+
+def test_reads_a_batch_within_the_limits():
+    body = b'[{"N": 1, "label": "a"}, {"N": 2, "label": "b"}]'
+    frame = asyncio.run(read_batch(make_request(body), Record, max_rows=10, max_bytes=len(body)))
+    assert frame["N"].tolist() == [1.0, 2.0]
+
+
+def test_content_length_over_the_byte_limit_is_rejected_before_reading():
+    request = make_request(b"[]", headers=[(b"content-length", b"1000")])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_batch(request, Record, max_rows=10, max_bytes=100))
+    assert error.value.status_code == 413
+
+
+def test_streamed_body_over_the_byte_limit_is_rejected():
+    body = b"[" + b",".join([b'{"N": 1, "label": "a"}'] * 20) + b"]"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_batch(make_request(body), Record, max_rows=1000, max_bytes=100))
+    assert error.value.status_code == 413
+
+
+def test_rows_over_the_row_limit_are_rejected():
+    body = b'[{"N": 1, "label": "a"}, {"N": 2, "label": "b"}]'
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_batch(make_request(body), Record, max_rows=1, max_bytes=len(body)))
+    assert error.value.status_code == 413
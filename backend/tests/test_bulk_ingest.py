@@ -0,0 +1,66 @@
+import asyncio
+import struct
+import zlib
+
+import pytest
+
+from bulk_ingest import UploadError, _LOCAL_HEADER, _LOCAL_HEADER_SIGNATURE, iter_zip_entries
+
+
+def local_entry(name, data, extra=b"", flags=0, method=0, compressed_size=None, size=None):
+    name = name.encode()
+    header = _LOCAL_HEADER.pack(
+        _LOCAL_HEADER_SIGNATURE, 20, flags, method, 0, 0, zlib.crc32(data),
+        len(data) if compressed_size is None else compressed_size,
+        len(data) if size is None else size, len(name), len(extra),
+    )
+    return header + name + extra + data
+
+
+def read_all(body, max_entry_size=1 << 20, chunk_size=4096):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    async def collect():
+        return [entry async for entry in iter_zip_entries(chunks(), max_entry_size)]
+
+    return asyncio.run(collect())
+
+
+def test_stored_entry():
+    assert read_all(local_entry("leaf.jpg", b"pixels")) == [("leaf.jpg", b"pixels")]
+
+
+def test_zip64_extra_with_too_few_values():
+    # Both sizes overflow, but the extra only carries one of them
+    extra = struct.pack("<HHQ", 0x0001, 8, 6)
+    body = local_entry("leaf.jpg", b"pixels", extra, compressed_size=0xFFFFFFFF, size=0xFFFFFFFF)
+    with pytest.raises(UploadError):
+        read_all(body)
+
+
+def test_truncated_zip64_extra():
+    # The extra claims 16 bytes of sizes but the header ends after 8
+    extra = struct.pack("<HHQ", 0x0001, 16, 6)
+    body = local_entry("leaf.jpg", b"pixels", extra, compressed_size=0xFFFFFFFF, size=0xFFFFFFFF)
+    with pytest.raises(UploadError):
+        read_all(body)
+
+
+def test_deflated_entry_with_descriptor_is_bounded():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(b"\0" * (8 << 20)) + compressor.flush()
+    body = local_entry("leaf.jpg", deflated, flags=0x8, method=8, compressed_size=0, size=0)
+    with pytest.raises(UploadError, match="byte limit"):
+        read_all(body, max_entry_size=1024, chunk_size=len(body))
+
+
+def test_deflated_entry_with_descriptor():
+    data = bytes(range(256)) * 64
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    descriptor = struct.pack("<4sIII", b"PK\x07\x08", zlib.crc32(data), len(deflated), len(data))
+    body = local_entry("leaf.jpg", deflated, flags=0x8, method=8, compressed_size=0, size=0) + descriptor
+    body += local_entry("leaf.png", b"pixels")
+    assert read_all(body, chunk_size=7) == [("leaf.jpg", data), ("leaf.png", b"pixels")]
@@ -0,0 +1,26 @@
+from memory_report import mapped_file_memory
+
+SMAPS = """\
+7f0000000000-7f0000100000 r--s 00000000 08:01 1234                       {path}
+Size:               1024 kB
+Rss:                 512 kB
+Pss:                 512 kB
+VmFlags: rd mr me ms sd
+7f0000100000-7f0000200000 rw-p 00000000 00:00 0
+Size:               1024 kB
+Rss:                 768 kB
+Pss:                 768 kB
+VmFlags: rd wr mr mw me ac sd
+7ffd00000000-7ffd00021000 rw-p 00000000 00:00 0                          [stack]
+Size:                132 kB
+Rss:                  16 kB
+VmFlags: rd wr mr mw me gd ac
+"""
+
+
+def test_anonymous_mappings_are_not_counted_for_the_file_before_them(tmp_path):
+    model_path = tmp_path / "model.joblib"
+    model_path.write_bytes(b"")
+    smaps = tmp_path / "smaps"
+    smaps.write_text(SMAPS.format(path=model_path))
+    assert mapped_file_memory([str(model_path)], str(smaps)) == {str(model_path): 512 * 1024}
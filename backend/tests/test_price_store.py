@@ -0,0 +1,56 @@
+import pandas as pd
+
+from price_store import PriceStore
+
+CROPS = ["Wheat", "Rice"]
+
+
+def write_csv(path, dates, mode="w"):
+    with open(path, mode) as f:
+        if mode == "w":
+            f.write("Date," + ",".join(CROPS) + "\n")
+        for i, date in enumerate(dates):
+            f.write(f"{date},{1000 + i},{2000 + i}\n")
+
+
+def weeks(start, count):
+    return [str(date.date()) for date in pd.date_range(start, periods=count, freq="7D")]
+
+
+def api_row(date):
+    return pd.DataFrame({"Wheat": [1500.0], "Rice": [2500.0]}, index=pd.DatetimeIndex([date]))
+
+
+def stored_dates(store):
+    store.refresh(force=True)
+    dates, _ = store._read_rows(0, store.meta["rows"])
+    return [str(date) for date in dates]
+
+
+def test_api_week_survives_csv_appends_around_it(tmp_path):
+    csv_path = str(tmp_path / "prices.csv")
+    write_csv(csv_path, weeks("2023-10-01", 5))
+    store = PriceStore.open(str(tmp_path / "store"), csv_path)
+    store.append(api_row("2023-11-05"))
+
+    write_csv(csv_path, ["2023-11-12"], mode="a")
+    assert stored_dates(store)[-2:] == ["2023-11-05", "2023-11-12"]
+    write_csv(csv_path, ["2023-11-19"], mode="a")
+    assert stored_dates(store)[-3:] == ["2023-11-05", "2023-11-12", "2023-11-19"]
+    assert store.meta["api_dates"] == ["2023-11-05"]
+
+
+def test_rewritten_csv_keeps_api_weeks_it_does_not_have(tmp_path):
+    csv_path = str(tmp_path / "prices.csv")
+    write_csv(csv_path, weeks("2023-10-01", 5))
+    store = PriceStore.open(str(tmp_path / "store"), csv_path)
+    store.append(api_row("2023-11-05"))
+    store.append(api_row("2023-11-12"))
+
+    # The rewrite adds an earlier week and covers 11-12 but skips 11-05, which has to be merged back in
+    write_csv(csv_path, weeks("2023-09-24", 6) + ["2023-11-12", "2023-11-19"])
+    assert stored_dates(store) == weeks("2023-09-24", 6) + ["2023-11-05", "2023-11-12", "2023-11-19"]
+    assert store.meta["api_dates"] == ["2023-11-05"]
+    window = store.window(3)
+    assert window.prices[0].tolist() == [1500.0, 2500.0]
+    assert window.prices[1].tolist() == [1006.0, 2006.0]
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import httpx
+
+from coalescing import InflightRequests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://api.weatherapi.com/v1"
+
+# Upstream statuses worth retrying; anything else in 4xx is the caller's fault
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def normalize_city(city):
+    """Canonical cache key for a city name: case- and whitespace-insensitive."""
+    return " ".join(city.split()).casefold()
+
+
+def summarize_forecast(payload):
+    """Reduces a weatherapi.com forecast.json payload to the fields CROPIX returns."""
+    forecast_summary = []
+    for day_data in payload['forecast']['forecastday']:
+        day_info = day_data['day']
+        forecast_summary.append({
+            "date": day_data['date'],
+            "min_temp_c": day_info['mintemp_c'],
+            "max_temp_c": day_info['maxtemp_c'],
+            "avg_temp_c": day_info['avgtemp_c'],
+            "avg_humidity": day_info['avghumidity'],
+            "chance_of_rain": day_info['daily_chance_of_rain'],
+            "condition": day_info['condition']['text']
+        })
+    return forecast_summary
+
+
+def columnar_forecast(forecast_summary):
+    """The per-day summary as `{"start", "step_days", "values": {field: [...]}}`, without repeated keys."""
+    if not forecast_summary:
+        return {"start": None, "step_days": 1, "values": {}}
+    fields = [field for field in forecast_summary[0] if field != "date"]
+    return {
+        "start": forecast_summary[0]["date"],
+        "step_days": 1,
+        "values": {field: [day[field] for day in forecast_summary] for field in fields},
+    }
+
+
+class WeatherClient:
+    """Non-blocking weatherapi.com client with a pooled connection, retries and a TTL cache.
+
+    Results are cached per (normalized city, days) for `cache_ttl` seconds, and
+    concurrent lookups of the same key share a single upstream request.
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, cache_ttl=600.0, cache_size=1024,
+                 timeout=5.0, retries=2, backoff=0.2, max_connections=20):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_requests = 0
+        self._cache = OrderedDict()  # key -> (expires_at, forecast_summary)
+        self._inflight = InflightRequests()
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def forecast(self, city, days):
+        """Returns the per-day forecast summary for `city`, from cache when possible."""
+        key = (normalize_city(city), int(days))
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return entry[1]
+            del self._cache[key]
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        return await self._inflight.run(key, lambda: self._fetch_and_cache(key))
+
+    async def _fetch_and_cache(self, key):
+        city, days = key
+        payload = await self._get_with_retries({"key": self.api_key, "q": city, "days": days})
+        forecast_summary = summarize_forecast(payload)
+
+        self._cache[key] = (time.monotonic() + self.cache_ttl, forecast_summary)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return forecast_summary
+
+    async def _get_with_retries(self, params):
+        client = self._get_client()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                self.upstream_requests += 1
+                response = await client.get("/forecast.json", params=params)
+                if response.status_code in RETRYABLE_STATUS_CODES and not last_attempt:
+                    logger.warning("Weather API returned %s, retrying", response.status_code)
+                else:
+                    response.raise_for_status()
+                    return response.json()
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                logger.warning("Weather API request failed (%s), retrying", e)
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def stats(self):
+        return {
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_requests": self.upstream_requests,
+        }
@@ -0,0 +1,87 @@
+"""What-if search for the input levels that maximise the crop yield model's prediction.
+
+`optimize` evaluates a full grid over the requested ranges, a chunk of points
+per model call, and then zooms in around the best point (each round searches
+one grid step either side of it at the same resolution) while the time budget
+allows. The coarse grid is returned as the response surface.
+"""
+import time
+
+import numpy as np
+
+
+def grid_axes(ranges):
+    """`{column: (low, high, steps)}` -> `{column: evenly spaced values}`."""
+    return {
+        column: np.linspace(low, high, steps if high > low else 1)
+        for column, (low, high, steps) in ranges.items()
+    }
+
+
+def grid_points(axes):
+    """Every combination of the axes' values, as `{column: flat array}` in C (row-major) order."""
+    mesh = np.meshgrid(*axes.values(), indexing="ij")
+    return {column: values.ravel() for column, values in zip(axes, mesh)}
+
+
+async def evaluate_grid(predict, axes, deadline, chunk_size):
+    """Predicts every grid point until `deadline`; points not reached are NaN. Returns (values, evaluated)."""
+    points = grid_points(axes)
+    count = len(next(iter(points.values())))
+    values = np.full(count, np.nan)
+    evaluated = 0
+    for start in range(0, count, chunk_size):
+        # The first chunk always runs, so even a tiny budget returns something
+        if start and time.monotonic() >= deadline:
+            break
+        chunk = {column: column_values[start:start + chunk_size] for column, column_values in points.items()}
+        values[start:start + chunk_size] = np.asarray(await predict(chunk), dtype=np.float64).reshape(-1)
+        evaluated = min(start + chunk_size, count)
+    return values.reshape([len(axis) for axis in axes.values()]), evaluated
+
+
+def _best(axes, values):
+    index = np.unravel_index(np.nanargmax(values), values.shape)
+    return {column: float(axis[i]) for (column, axis), i in zip(axes.items(), index)}, float(values[index])
+
+
+async def optimize(predict, ranges, time_budget, chunk_size=10_000, refine_rounds=2):
+    """Grid search plus local refinement, stopping early when `time_budget` seconds run out.
+
+    `predict({column: values})` is a coroutine returning one prediction per point.
+    """
+    started = time.monotonic()
+    deadline = started + time_budget
+    axes = grid_axes(ranges)
+    surface, evaluated = await evaluate_grid(predict, axes, deadline, chunk_size)
+    complete = evaluated == surface.size
+    best_point, best_value = _best(axes, surface)
+
+    rounds = 0
+    current_axes = axes
+    while rounds < refine_rounds and complete and time.monotonic() < deadline:
+        local_ranges = {}
+        for column, (low, high, steps) in ranges.items():
+            axis = current_axes[column]
+            spacing = axis[1] - axis[0] if len(axis) > 1 else 0.0
+            centre = best_point[column]
+            local_ranges[column] = (max(low, centre - spacing), min(high, centre + spacing), steps)
+        current_axes = grid_axes(local_ranges)
+        values, local_evaluated = await evaluate_grid(predict, current_axes, deadline, chunk_size)
+        evaluated += local_evaluated
+        rounds += 1
+        if local_evaluated and np.nanmax(values) > best_value:
+            best_point, best_value = _best(current_axes, values)
+
+    return {
+        "optimum": {**best_point, "predicted_yield": best_value},
+        "surface": {
+            "axes": {column: axis.tolist() for column, axis in axes.items()},
+            # Points the budget didn't reach are null
+            "predicted_yield": np.where(np.isnan(surface), None, surface).tolist(),
+        },
+        "evaluated_points": evaluated,
+        "complete": complete,
+        "refine_rounds": rounds,
+        "elapsed_ms": (time.monotonic() - started) * 1000,
+    }